@@ -1,10 +1,12 @@
-import requests
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from backend.capitals_data import get_capitals
-from backend.data.new_database import PostgresDB
+from backend.data.new_database import get_db
+from backend.http_client import get_client, CircuitOpenError
 
 
 # loads the environment variable from .evn file
@@ -13,16 +15,21 @@ load_dotenv()
 # WAQI API token
 WQAI_API_KEY = os.getenv("WQAI_API_KEY")
 
+# base url of the WAQI API (can point to a local stub server for testing)
+WAQI_BASE_URL = os.getenv("WAQI_BASE_URL", "https://api.waqi.info").rstrip("/")
+
+# maximum number of parallel requests during a sweep (1 = sequential)
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", "16"))
+
 def fetch_aqi(city):
     """
     Fetch real-time AQI-data for a specific city using the WAQI API.
     Returns a dictionary with AQI and metadata, or Nine if the request fails.
     """
-    url = f"https://api.waqi.info/feed/{city}/?token={WQAI_API_KEY}"
+    url = f"{WAQI_BASE_URL}/feed/{city}/?token={WQAI_API_KEY}"
     
     try:
-        res = requests.get(url, timeout=5)
-        data = res.json()
+        data = get_client().get_json(url)
 
         if data["status"] == "ok":
             return {
@@ -32,53 +39,102 @@ def fetch_aqi(city):
                 "lon": data["data"]["city"]["geo"][1], # latitude
                 "timestamp": datetime.now().isoformat()  # saves the timestamp
             }
+    except CircuitOpenError as e:
+        print(e)
     except Exception:
         pass
     
     return None
 
-def fetch_and_store_aqi_for_all_countries():
+def fetch_aqi_for_capitals(capitals_list, max_workers=FETCH_MAX_WORKERS, on_progress=None):
+    '''
+    This function fetches the aqi data of all given capitals with a bounded thread pool.
+    Returns a list of (entry, aqi_data, latency in seconds) in the order of capitals_list.
+    on_progress: called with (done, total) after every fetched capital.
+    '''
+    def timed_fetch(entry):
+        start = time.perf_counter()
+        aqi_data = get_aqi_for_city(entry["city"], entry["country"])
+        return entry, aqi_data, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(timed_fetch, entry) for entry in capitals_list]
+        if on_progress is not None:
+            for done, _ in enumerate(as_completed(futures), start=1):
+                on_progress(done, len(futures))
+        return [future.result() for future in futures]
+
+def report_sweep(results, wall_time):
+    '''
+    This function prints the wall-clock time and the latencies of a sweep.
+    Returns the report as dictionary.
+    '''
+    latencies = {entry["city"]: round(latency, 3) for entry, _, latency in results}
+    failed = [entry["city"] for entry, aqi_data, _ in results if not aqi_data]
+    report = {
+        "wall_time": round(wall_time, 3),
+        "capitals": len(results),
+        "failed": failed,
+        "latencies": latencies,
+    }
+    if latencies:
+        ordered = sorted(latencies.values())
+        slowest = max(latencies, key=latencies.get)
+        report["median_latency"] = ordered[len(ordered) // 2]
+        report["max_latency"] = latencies[slowest]
+        print(f"Sweep finished in {wall_time:.1f}s: {len(results) - len(failed)}/{len(results)} capitals fetched, "
+              f"median latency {report['median_latency']:.2f}s, slowest {slowest} ({report['max_latency']:.2f}s)")
+    return report
+
+def fetch_and_store_aqi_for_all_countries(max_workers=FETCH_MAX_WORKERS, on_progress=None):
     """
     Holt und speichert AQI-Daten für alle Hauptstädte in der PostgreSQL-DB.
     Nutzt Fallback-Daten, falls API nicht erreichbar ist.
 
     Gets and saves aqi data for all capitals in the PostgreSQL-DB.
     Uses fallback data, if api is not reachable.
+    The capitals are fetched concurrently with at most max_workers parallel requests.
+    Returns the sweep report with wall-clock time and latency per city.
+    on_progress: called with (done, total) after every fetched capital.
     """
     print("Updating AQI-Data for all capitals...")
 
     capitals_list = get_capitals()
-    db = PostgresDB()
+    db = get_db()
 
-    for entry in capitals_list:
-        country = entry["country"]
-        capital = entry["city"]
-        aqi_data = get_aqi_for_city(capital, country)  # gets data from fallback
+    start = time.perf_counter()
+    results = fetch_aqi_for_capitals(capitals_list, max_workers=max_workers, on_progress=on_progress)
+    report = report_sweep(results, time.perf_counter() - start)
 
+    rows = []
+    for entry, aqi_data, _ in results:
         if aqi_data:
-            # checks if all values exists and are correct
-            if None in [aqi_data.get("lat"), aqi_data.get("lon"), aqi_data.get("aqi")]:
-                print(f"Uncorrect data for {country}: {capital}, skip insert: {aqi_data}")
-                continue
-            try:
-                db.insert_aqi(
-                    country=country,
-                    city=capital,
-                    lat=aqi_data["lat"],
-                    lon=aqi_data["lon"],
-                    aqi=aqi_data["aqi"],
-                    timestamp=aqi_data["timestamp"]
-                )
-                print(f"{country}: {capital} - AQI: {aqi_data['aqi']} ({aqi_data['timestamp']}) saved!")
-            except Exception as e:
-                print(f"Error while saving in the database for {country}: {capital}: {e}")
-                try:
-                    db.conn.rollback()
-                except Exception as rollback_e:
-                    print(f"Rollback error: {rollback_e}")
-
+            rows.append({
+                "country": entry["country"],
+                "city": entry["city"],
+                "lat": aqi_data.get("lat"),
+                "lon": aqi_data.get("lon"),
+                "aqi": aqi_data.get("aqi"),
+                "timestamp": aqi_data.get("timestamp")
+            })
         else:
-            print(f"Error by calling the data of {country}: {capital}")
+            print(f"Error by calling the data of {entry['country']}: {entry['city']}")
+
+    # saves the whole sweep in one transaction
+    try:
+        result = db.insert_aqi_bulk(rows)
+    except Exception as e:
+        print(f"Error while saving the sweep in the database: {e}")
+        result = {"inserted": 0, "rejected": [{"row": row, "reason": str(e)} for row in rows]}
+
+    for rejected in result["rejected"]:
+        row = rejected["row"]
+        print(f"Uncorrect data for {row['country']}: {row['city']}, skip insert ({rejected['reason']}): {row}")
+    print(f"{result['inserted']} AQI values saved, {len(result['rejected'])} rejected.")
+
+    report["inserted"] = result["inserted"]
+    report["rejected"] = result["rejected"]
+    return report
 
 
 def get_aqi_for_city(city, country):
@@ -0,0 +1,102 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import time
+import argparse
+from datetime import datetime, timedelta
+from backend.data.new_database import get_db, apply_schema, create_partitions
+
+# separate schema, so the benchmark never touches the real aqi data
+BENCHMARK_SCHEMA = "aqi_benchmark"
+
+QUERIES = {
+    "DISTINCT ON aqi_data (old map query)": """
+        SELECT DISTINCT ON (country, city) country, city, lat, lon, aqi, timestamp
+        FROM aqi_data
+        ORDER BY country, city, timestamp DESC
+    """,
+    "ROW_NUMBER aqi_data (old get_latest_aqi)": """
+        SELECT country, city, lat, lon, aqi, timestamp
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY country ORDER BY timestamp DESC) as rn
+            FROM aqi_data
+        ) sub
+        WHERE rn = 1
+    """,
+    "latest_aqi (new map query)": """
+        SELECT country, city, lat, lon, aqi, timestamp
+        FROM latest_aqi
+        ORDER BY country, city
+    """,
+    "one city, last 24 hours": """
+        SELECT timestamp, aqi FROM aqi_data
+        WHERE city = 'city_7' AND timestamp >= NOW() - INTERVAL '1 day'
+        ORDER BY timestamp
+    """,
+}
+
+def fill_table(cur, rows, capitals):
+    '''
+    This function fills the benchmark tables with synthetic 15 minute readings of all capitals.
+    '''
+    cur.execute("TRUNCATE aqi_data, latest_aqi;")
+    now = datetime.now()
+    create_partitions(cur, now - timedelta(minutes=15 * (rows // capitals + 1)), now)
+    cur.execute("""
+        INSERT INTO aqi_data (country, city, lat, lon, aqi, timestamp)
+        SELECT 'country_' || (i %% %(capitals)s), 'city_' || (i %% %(capitals)s), 0, 0,
+               (random() * 300)::int,
+               NOW() - ((i / %(capitals)s) * INTERVAL '15 minutes')
+        FROM generate_series(1, %(rows)s) AS i;
+    """, {"rows": rows, "capitals": capitals})
+    cur.execute("""
+        INSERT INTO latest_aqi (country, city, lat, lon, aqi, timestamp)
+        SELECT DISTINCT ON (country, city) country, city, lat, lon, aqi, timestamp
+        FROM aqi_data
+        ORDER BY country, city, timestamp DESC;
+    """)
+    cur.execute("ANALYZE aqi_data;")
+    cur.execute("ANALYZE latest_aqi;")
+
+def time_query(cur, query, repeats):
+    '''
+    This function returns the median runtime of a query in milliseconds.
+    '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        cur.execute(query)
+        cur.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+def main():
+    '''
+    This function compares the query time of the latest-reading queries for a growing aqi_data table.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark of the latest AQI queries.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20_000, 200_000, 2_000_000],
+                        help="row counts of aqi_data")
+    parser.add_argument("--capitals", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with get_db().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {BENCHMARK_SCHEMA};")
+            cur.execute(f"SET search_path TO {BENCHMARK_SCHEMA};")
+            try:
+                apply_schema(cur)
+                print(f"{'rows':>10} | " + " | ".join(f"{name:>40}" for name in QUERIES))
+                for rows in args.sizes:
+                    fill_table(cur, rows, args.capitals)
+                    timings = [time_query(cur, query, args.repeats) for query in QUERIES.values()]
+                    print(f"{rows:>10} | " + " | ".join(f"{t:>37.1f} ms" for t in timings))
+            finally:
+                cur.execute("SET search_path TO DEFAULT;")
+                cur.execute(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE;")
+
+if __name__ == "__main__":
+    main()
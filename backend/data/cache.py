@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+import functools
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# maximum number of cached query results and their lifetime in seconds (one ingest period)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "900"))
+
+
+class TTLCache:
+    '''
+    This class is a thread-safe LRU cache whose entries expire after ttl seconds.
+    It holds at most maxsize entries and counts hits, misses and evictions.
+    Every clear() starts a new generation, results computed before are not stored anymore.
+    '''
+    def __init__(self, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        This function returns (True, value) for a valid entry, otherwise (False, None).
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, generation=None):
+        '''
+        This function stores a value and evicts the least recently used entries.
+        A value of an older generation is ignored.
+        '''
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_ttl(self, ttl):
+        with self._lock:
+            self.ttl = ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        '''
+        This function returns the counters of the cache.
+        '''
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "ttl": self.ttl,
+                "generation": self.generation
+            }
+
+
+# shared by all sessions of the process
+query_cache = TTLCache()
+
+def cached_query(func):
+    '''
+    This decorator caches the results of a read function, keyed by its name and parameters.
+    The results stay valid until new data is ingested, see invalidate_cache, or the ttl is over.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+        found, value = query_cache.get(key)
+        if found:
+            return value
+        generation = query_cache.generation
+        value = func(*args, **kwargs)
+        query_cache.set(key, value, generation=generation)
+        return value
+    return wrapper
+
+def invalidate_cache():
+    '''
+    This function drops all cached query results, e.g. after a new sweep was ingested.
+    '''
+    query_cache.clear()
+
+def cache_stats():
+    return query_cache.stats()
@@ -0,0 +1,167 @@
+import os
+import sys
+import csv
+import time
+import queue
+import itertools
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# a job which runs longer is stopped (seconds)
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", str(3 * 3600)))
+# every finished or skipped run is appended to this csv file
+JOB_LOG_PATH = Path(os.getenv("JOB_LOG_PATH", str(Path(__file__).resolve().parent / "job_runs.csv")))
+
+# background jobs: lower number = higher priority, command runs in its own process
+JOBS = {
+    "train": (1, [sys.executable, "-m", "backend.models.train_model", "--incremental"]),
+    "evaluate": (2, [sys.executable, "-m", "backend.models.evaluation"]),
+}
+
+
+class JobRecorder:
+    '''
+    This class records the runs of all jobs: runtime, status, which other jobs were running at the same time
+    and how many scheduled runs were missed.
+    '''
+    def __init__(self, log_path=JOB_LOG_PATH):
+        self.log_path = Path(log_path) if log_path else None
+        self.running = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _job_stats(self, name):
+        return self.stats.setdefault(name, {
+            "runs": 0, "failed": 0, "skipped": 0, "missed": 0, "overlaps": 0,
+            "last_start": None, "last_s": None, "max_s": 0.0, "total_s": 0.0
+        })
+
+    @contextmanager
+    def track(self, name):
+        '''
+        This context manager records one run of a job.
+        '''
+        start = time.perf_counter()
+        started_at = datetime.now()
+        with self._lock:
+            overlaps = sorted(self.running)
+            self.running[name] = started_at
+            stats = self._job_stats(name)
+            stats["last_start"] = started_at.isoformat(timespec="seconds")
+            if overlaps:
+                stats["overlaps"] += 1
+        if overlaps:
+            print(f"Job {name} started while {', '.join(overlaps)} is running.")
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                del self.running[name]
+                stats["runs"] += 1
+                stats["failed"] += status == "failed"
+                stats["last_s"] = round(duration, 3)
+                stats["max_s"] = max(stats["max_s"], round(duration, 3))
+                stats["total_s"] = round(stats["total_s"] + duration, 3)
+            self._log(name, started_at, duration, status, overlaps)
+            print(f"Job {name} finished ({status}) in {duration:.1f}s")
+
+    def skipped(self, name, reason):
+        with self._lock:
+            self._job_stats(name)["skipped"] += 1
+        self._log(name, datetime.now(), 0.0, "skipped", [])
+        print(f"Job {name} skipped: {reason}")
+
+    def missed(self, name, count, due):
+        '''
+        This function records scheduled runs of a job which were not started, because the scheduler was busy or asleep.
+        '''
+        with self._lock:
+            self._job_stats(name)["missed"] += count
+        self._log(name, due, 0.0, f"missed {count}", [])
+        print(f"Job {name} missed {count} run(s) since {due.isoformat(timespec='minutes')}")
+
+    def _log(self, name, started_at, duration, status, overlaps):
+        if self.log_path is None:
+            return
+        with self._lock:
+            new_file = not self.log_path.exists()
+            with open(self.log_path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["job", "started_at", "duration_s", "status", "overlaps"])
+                writer.writerow([name, started_at.isoformat(timespec="seconds"), round(duration, 3), status, " ".join(overlaps)])
+
+    def snapshot(self):
+        with self._lock:
+            return {"running": sorted(self.running), "jobs": {name: dict(stats) for name, stats in self.stats.items()}}
+
+
+class JobWorker:
+    '''
+    This class runs the background jobs one after another in its own thread, ordered by their priority.
+    Every job runs as a separate process, so it never blocks the ingestion of the scheduler.
+    A job is skipped, if the same job is still waiting or running.
+    '''
+    def __init__(self, recorder, jobs=JOBS, timeout=JOB_TIMEOUT):
+        self.recorder = recorder
+        self.jobs = jobs
+        self.timeout = timeout
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, name):
+        '''
+        This function queues a job. Returns False, if the job was skipped.
+        '''
+        with self._lock:
+            if name in self._pending:
+                skip = True
+            else:
+                skip = False
+                self._pending.add(name)
+        if skip:
+            self.recorder.skipped(name, "previous run is still in progress")
+            return False
+        priority, _ = self.jobs[name]
+        self._queue.put((priority, next(self._order), name))
+        return True
+
+    def _run(self):
+        while True:
+            _, _, name = self._queue.get()
+            try:
+                with self.recorder.track(name):
+                    self._run_job(name)
+            except Exception as e:
+                print(f"Job {name} failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(name)
+
+    def _run_job(self, name):
+        _, command = self.jobs[name]
+        result = subprocess.run(command, cwd=ROOT_DIR, timeout=self.timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command[1:])} exited with code {result.returncode}")
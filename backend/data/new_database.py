@@ -1,43 +1,622 @@
 import psycopg2
-from datetime import datetime
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import os
+import re
+import time
+import select
+import uuid
+import threading
 from dotenv import load_dotenv
+from backend.data.cache import invalidate_cache
 
 load_dotenv()
 
-class PostgresDB:
-    def __init__(self):
+# minimum and maximum number of open connections per process
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# days of raw 15 minute readings and of hourly aggregates which are kept, daily aggregates are kept forever
+RAW_RETENTION_DAYS = int(os.getenv("RAW_RETENTION_DAYS", "35"))
+HOURLY_RETENTION_DAYS = int(os.getenv("HOURLY_RETENTION_DAYS", "400"))
+
+# rows per chunk when the history is streamed with a server-side cursor
+HISTORY_CHUNK_SIZE = int(os.getenv("HISTORY_CHUNK_SIZE", "5000"))
+
+
+def connection_params():
+    '''
+    This function returns the connection parameters of the database out of the environment.
+    '''
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT")
+    }
+
+
+class ConnectionPool:
+    '''
+    This class is a thread-safe pool of database connections.
+    If all connections are in use, callers wait until one is returned.
+    It counts checkouts, waits and the time spent waiting.
+    '''
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+        self.maxconn = maxconn
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **connection_params())
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.in_use = 0
+
+    @contextmanager
+    def connection(self):
         '''
-        This function connect the database and ensures that the aqi_data table exists.
+        This function checks out a connection and gives it back afterwards.
+        The transaction is committed on success and rolled back on an error.
         '''
-        self.conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT")
-        )
-        self.create_table()
+        if not self._slots.acquire(blocking=False):
+            start = time.perf_counter()
+            self._slots.acquire()
+            with self._lock:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - start
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # also closed generators, so no open transaction goes back into the pool
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            # broken connections are closed instead of being reused
+            self._pool.putconn(conn, close=bool(conn.closed))
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
 
-    def create_table(self):
+    def stats(self):
         '''
-        This function initialize the aqi_data table if it does not exist.
-        Columns: id, country, city=capital, lat=latitude, lon=longitude, aqi, timestamp
+        This function returns the statistics of the pool.
         '''
-        query = """
-        CREATE TABLE IF NOT EXISTS aqi_data (
-            id SERIAL PRIMARY KEY,
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_time": round(self.wait_time, 3),
+                "in_use": self.in_use,
+                "open_connections": len(self._pool._pool) + len(self._pool._used),
+                "max_connections": self.maxconn
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    '''
+    This function returns the connection pool of the current process.
+    A forked child process gets its own pool instead of sharing the sockets of its parent.
+    '''
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+def pool_stats():
+    '''
+    This function returns the statistics of the connection pool of the current process.
+    '''
+    return get_pool().stats()
+
+
+class AdvisoryLock:
+    '''
+    This class holds a Postgres session advisory lock on its own connection, e.g. to run a job in only one process of a deployment.
+    The lock is released when the connection closes, also if the process dies.
+    '''
+    def __init__(self, key):
+        self.key = key
+        self._conn = None
+
+    def acquire(self):
+        '''
+        This function tries to take the lock without waiting. Returns True, if this process holds it.
+        '''
+        if self.held():
+            return True
+        self.release()
+        self._conn = psycopg2.connect(**connection_params())
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (self.key,))
+            acquired = cur.fetchone()[0]
+        if not acquired:
+            self.release()
+        return acquired
+
+    def held(self):
+        '''
+        This function checks whether the connection, and with it the lock, is still alive.
+        '''
+        if self._conn is None or self._conn.closed:
+            return False
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except psycopg2.Error:
+            self.release()
+            return False
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+        self._conn = None
+
+
+# the listener connections detect a dead server or network without waiting for the next query
+LISTEN_KEEPALIVES = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "tcp_user_timeout": 30000
+}
+
+
+class NotificationListener:
+    '''
+    This class waits on its own connection for Postgres notifications (LISTEN) and calls the callbacks:
+    on_notify(notify) for every notification, on_connect() after (re)connecting, on_disconnect() if the connection is lost
+    and on_timeout() if nothing arrived for poll_seconds. It connects again after reconnect_seconds.
+    After every poll_seconds without a notification the connection is checked with a query,
+    so a half-open connection is noticed and stop() takes effect.
+    '''
+    def __init__(self, channels, on_notify=None, on_connect=None, on_disconnect=None, on_timeout=None,
+                 poll_seconds=60, reconnect_seconds=10):
+        self.channels = channels
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.on_timeout = on_timeout
+        self.poll_seconds = poll_seconds
+        self.reconnect_seconds = reconnect_seconds
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name=f"listen-{'-'.join(self.channels)}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**connection_params(), **LISTEN_KEEPALIVES)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    for channel in self.channels:
+                        cur.execute(f"LISTEN {channel};")
+                self.connected = True
+                print(f"Listening on {', '.join(self.channels)}.")
+                self._call(self.on_connect)
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_seconds)[0]:
+                        conn.poll()
+                    else:
+                        # raises, if the connection is dead
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1;")
+                        self._call(self.on_timeout)
+                    while conn.notifies:
+                        self._call(self.on_notify, conn.notifies.pop(0))
+            except Exception as e:
+                print(f"Listening on {', '.join(self.channels)} failed, connecting again: {e}")
+                self._stop.wait(self.reconnect_seconds)
+            finally:
+                if conn is not None:
+                    conn.close()
+                if self.connected:
+                    self.connected = False
+                    self._call(self.on_disconnect)
+
+    def _call(self, callback, *args):
+        if callback is not None:
+            callback(*args)
+
+
+# base table of all aqi readings
+CREATE_AQI_TABLE = """
+CREATE TABLE IF NOT EXISTS aqi_data (
+    id SERIAL PRIMARY KEY,
+    country TEXT,
+    city TEXT,
+    lat REAL,
+    lon REAL,
+    aqi INTEGER,
+    timestamp TIMESTAMP
+);
+"""
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def partition_name(month):
+    return f"aqi_data_y{month.year}m{month.month:02d}"
+
+def create_partitions(cur, start, end):
+    '''
+    This function creates the monthly partitions of aqi_data from the month of start to the month of end.
+    '''
+    month = month_start(start)
+    while month <= end:
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF aqi_data FOR VALUES FROM (%s) TO (%s);",
+            (month, next_month(month))
+        )
+        month = next_month(month)
+
+def list_partitions(cur):
+    '''
+    This function returns the monthly partitions of aqi_data as {name: first day of the month}.
+    '''
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'aqi_data'::regclass;
+    """)
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = re.fullmatch(r"aqi_data_y(\d{4})m(\d{2})", name)
+        if match:
+            partitions[name] = datetime(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+def partition_aqi_data(cur):
+    '''
+    This function converts aqi_data into a table which is partitioned by month of the timestamp.
+    Readings without timestamp can not be placed in a partition and are dropped.
+    '''
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'aqi_data'::regclass;")
+    if cur.fetchone()[0] == "p":
+        return
+    cur.execute("ALTER TABLE aqi_data RENAME TO aqi_data_unpartitioned;")
+    cur.execute("""
+        CREATE TABLE aqi_data (
+            id BIGSERIAL,
             country TEXT,
             city TEXT,
             lat REAL,
             lon REAL,
             aqi INTEGER,
-            timestamp TIMESTAMP
+            timestamp TIMESTAMP NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+    """)
+    # catches readings of months without partition, insert paths create the partitions beforehand
+    cur.execute("CREATE TABLE aqi_data_default PARTITION OF aqi_data DEFAULT;")
+    cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM aqi_data_unpartitioned;")
+    first, last = cur.fetchone()
+    now = datetime.now()
+    create_partitions(cur, first or now, next_month(max(last or now, now)))
+    cur.execute("""
+        INSERT INTO aqi_data (id, country, city, lat, lon, aqi, timestamp)
+        SELECT id, country, city, lat, lon, aqi, timestamp
+        FROM aqi_data_unpartitioned
+        WHERE timestamp IS NOT NULL;
+    """)
+    cur.execute("SELECT setval(pg_get_serial_sequence('aqi_data', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM aqi_data;")
+    cur.execute("DROP TABLE aqi_data_unpartitioned;")
+    cur.execute("CREATE INDEX IF NOT EXISTS aqi_data_city_timestamp_idx ON aqi_data (city, timestamp);")
+    cur.execute("CREATE INDEX IF NOT EXISTS aqi_data_country_city_timestamp_idx ON aqi_data (country, city, timestamp);")
+
+# schema migrations as (version, description, sql or function of the cursor), applied in order and recorded in schema_migrations
+SCHEMA_MIGRATIONS = [
+    (1, "index on aqi_data (city, timestamp)", """
+        CREATE INDEX IF NOT EXISTS aqi_data_city_timestamp_idx
+        ON aqi_data (city, timestamp);
+    """),
+    (2, "index on aqi_data (country, city, timestamp)", """
+        CREATE INDEX IF NOT EXISTS aqi_data_country_city_timestamp_idx
+        ON aqi_data (country, city, timestamp);
+    """),
+    (3, "latest_aqi table with the newest reading per capital", """
+        CREATE TABLE IF NOT EXISTS latest_aqi (
+            country TEXT NOT NULL,
+            city TEXT NOT NULL,
+            lat REAL,
+            lon REAL,
+            aqi INTEGER,
+            timestamp TIMESTAMP,
+            PRIMARY KEY (country, city)
         );
-        """
-        with self.conn.cursor() as cur:
-            cur.execute(query)
-            self.conn.commit()
+        INSERT INTO latest_aqi (country, city, lat, lon, aqi, timestamp)
+        SELECT DISTINCT ON (country, city) country, city, lat, lon, aqi, timestamp
+        FROM aqi_data
+        WHERE country IS NOT NULL AND city IS NOT NULL
+        ORDER BY country, city, timestamp DESC
+        ON CONFLICT (country, city) DO NOTHING;
+    """),
+    (4, "monthly range partitions of aqi_data", partition_aqi_data),
+    (5, "hourly and daily aggregate tables", """
+        CREATE TABLE IF NOT EXISTS aqi_hourly (
+            country TEXT NOT NULL,
+            city TEXT NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            lat REAL,
+            lon REAL,
+            aqi_min INTEGER,
+            aqi_mean REAL,
+            aqi_max INTEGER,
+            samples INTEGER,
+            PRIMARY KEY (country, city, bucket)
+        );
+        CREATE INDEX IF NOT EXISTS aqi_hourly_city_bucket_idx ON aqi_hourly (city, bucket);
+        CREATE TABLE IF NOT EXISTS aqi_daily (
+            country TEXT NOT NULL,
+            city TEXT NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            lat REAL,
+            lon REAL,
+            aqi_min INTEGER,
+            aqi_mean REAL,
+            aqi_max INTEGER,
+            samples INTEGER,
+            PRIMARY KEY (country, city, bucket)
+        );
+        CREATE INDEX IF NOT EXISTS aqi_daily_city_bucket_idx ON aqi_daily (city, bucket);
+    """),
+    (6, "forecasts table with precomputed hourly predictions", """
+        CREATE TABLE IF NOT EXISTS forecasts (
+            city TEXT NOT NULL,
+            ds TIMESTAMP NOT NULL,
+            yhat REAL,
+            yhat_lower REAL,
+            yhat_upper REAL,
+            generated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (city, ds)
+        );
+    """),
+    (7, "sweep_requests queue of the ingest worker", """
+        CREATE TABLE IF NOT EXISTS sweep_requests (
+            id BIGSERIAL PRIMARY KEY,
+            source TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            requested_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            total INTEGER,
+            done INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER,
+            rejected INTEGER,
+            error TEXT
+        );
+        -- at most one sweep is queued or running at a time
+        CREATE UNIQUE INDEX IF NOT EXISTS sweep_requests_active_idx
+        ON sweep_requests ((true)) WHERE status IN ('queued', 'running');
+    """),
+]
+
+# channel on which the ingest worker is woken up for new sweep requests
+SWEEP_REQUEST_CHANNEL = "sweep_requests"
+# channel on which the ingest worker publishes the id of every finished sweep
+SWEEP_DONE_CHANNEL = "sweep_done"
+# a running sweep without progress for this long is considered dead (worker crashed)
+SWEEP_TIMEOUT_MINUTES = int(os.getenv("SWEEP_TIMEOUT_MINUTES", "30"))
+
+SWEEP_COLUMNS = ["id", "source", "status", "requested_at", "started_at", "updated_at", "finished_at",
+                 "total", "done", "inserted", "rejected", "error"]
+
+# tables of the aqi history from fine to coarse: (resolution, table, aqi column, time column, retention in days)
+HISTORY_TABLES = [
+    ("raw", "aqi_data", "aqi", "timestamp", RAW_RETENTION_DAYS),
+    ("hourly", "aqi_hourly", "aqi_mean", "bucket", HOURLY_RETENTION_DAYS),
+    ("daily", "aqi_daily", "aqi_mean", "bucket", None),
+]
+RESOLUTIONS = [entry[0] for entry in HISTORY_TABLES]
+
+def history_table(days, resolution="raw"):
+    '''
+    This function routes a history query of the last days to the coarsest table
+    which is not coarser than the requested resolution and still holds the whole window.
+    If no such table exists, the finest table holding the window is used.
+    '''
+    allowed = RESOLUTIONS.index(resolution)
+    covering = [entry for entry in HISTORY_TABLES if entry[4] is None or days <= entry[4]]
+    fine_enough = [entry for entry in covering if RESOLUTIONS.index(entry[0]) <= allowed]
+    return fine_enough[-1] if fine_enough else covering[0]
+
+def history_columns(entry):
+    '''
+    This function maps the selectable history columns to the columns of a history table.
+    Raw readings return their aqi for mean, min and max.
+    '''
+    _, _, aqi_col, time_col, _ = entry
+    aggregated = aqi_col != "aqi"
+    return {
+        "country": "country",
+        "city": "city",
+        "lat": "lat",
+        "lon": "lon",
+        "timestamp": time_col,
+        "aqi": aqi_col,
+        "aqi_min": "aqi_min" if aggregated else "aqi",
+        "aqi_max": "aqi_max" if aggregated else "aqi",
+    }
+
+# upserts the aggregates from the newest existing bucket on, so the current bucket is refreshed
+ROLLUP_HOURLY = """
+INSERT INTO aqi_hourly (country, city, bucket, lat, lon, aqi_min, aqi_mean, aqi_max, samples)
+SELECT country, city, date_trunc('hour', timestamp) AS hour,
+       AVG(lat), AVG(lon), MIN(aqi), AVG(aqi), MAX(aqi), COUNT(aqi)
+FROM aqi_data
+WHERE timestamp >= (SELECT COALESCE(MAX(bucket), '-infinity'::timestamp) FROM aqi_hourly)
+  AND country IS NOT NULL AND city IS NOT NULL AND aqi IS NOT NULL
+GROUP BY country, city, hour
+ON CONFLICT (country, city, bucket) DO UPDATE SET
+    lat = EXCLUDED.lat, lon = EXCLUDED.lon, aqi_min = EXCLUDED.aqi_min,
+    aqi_mean = EXCLUDED.aqi_mean, aqi_max = EXCLUDED.aqi_max, samples = EXCLUDED.samples;
+"""
+
+ROLLUP_DAILY = """
+INSERT INTO aqi_daily (country, city, bucket, lat, lon, aqi_min, aqi_mean, aqi_max, samples)
+SELECT country, city, date_trunc('day', bucket) AS day,
+       AVG(lat), AVG(lon), MIN(aqi_min), SUM(aqi_mean * samples) / SUM(samples), MAX(aqi_max), SUM(samples)
+FROM aqi_hourly
+WHERE bucket >= (SELECT COALESCE(MAX(bucket), '-infinity'::timestamp) FROM aqi_daily)
+GROUP BY country, city, day
+ON CONFLICT (country, city, bucket) DO UPDATE SET
+    lat = EXCLUDED.lat, lon = EXCLUDED.lon, aqi_min = EXCLUDED.aqi_min,
+    aqi_mean = EXCLUDED.aqi_mean, aqi_max = EXCLUDED.aqi_max, samples = EXCLUDED.samples;
+"""
+
+# keeps latest_aqi up to date, older readings never overwrite newer ones
+UPSERT_LATEST_AQI = """
+INSERT INTO latest_aqi (country, city, lat, lon, aqi, timestamp)
+VALUES %s
+ON CONFLICT (country, city) DO UPDATE SET
+    lat = EXCLUDED.lat,
+    lon = EXCLUDED.lon,
+    aqi = EXCLUDED.aqi,
+    timestamp = EXCLUDED.timestamp
+WHERE latest_aqi.timestamp IS NULL OR EXCLUDED.timestamp >= latest_aqi.timestamp;
+"""
+
+# random key for the advisory lock, so only one process migrates at the same time
+MIGRATION_LOCK_KEY = 4711001
+
+def apply_schema(cur):
+    '''
+    This function creates the aqi_data table and applies all missing schema migrations.
+    Returns the versions which were applied.
+    '''
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+    cur.execute(CREATE_AQI_TABLE)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    cur.execute("SELECT version FROM schema_migrations;")
+    done = {row[0] for row in cur.fetchall()}
+    applied = []
+    for version, description, sql in SCHEMA_MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying schema migration {version}: {description}")
+        if callable(sql):
+            sql(cur)
+        else:
+            cur.execute(sql)
+        cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s);", (version, description))
+        applied.append(version)
+    return applied
+
+def latest_rows(values):
+    '''
+    This function keeps only the newest row per (country, city) of a list of row tuples,
+    because one upsert statement must not touch the same row twice.
+    '''
+    latest = {}
+    for value in values:
+        key = (value[0], value[1])
+        if key not in latest or value[5] >= latest[key][5]:
+            latest[key] = value
+    return list(latest.values())
+
+
+class PostgresDB:
+    # the schema is set up only once per process
+    _schema_ready = False
+    _schema_lock = threading.Lock()
+
+    # months whose partition is known to exist in this process
+    _partitions = set()
+    _partitions_lock = threading.Lock()
+
+    def __init__(self):
+        '''
+        This function uses the shared connection pool and ensures that the aqi_data table exists.
+        '''
+        with PostgresDB._schema_lock:
+            if not PostgresDB._schema_ready:
+                self.create_table()
+                PostgresDB._schema_ready = True
+
+    def connection(self):
+        '''
+        This function checks out a connection of the process pool (use it in a with block).
+        '''
+        return get_pool().connection()
+
+    def create_table(self):
+        '''
+        This function initialize the aqi_data table if it does not exist and applies the schema migrations.
+        Columns: id, country, city=capital, lat=latitude, lon=longitude, aqi, timestamp
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                apply_schema(cur)
+                now = datetime.now()
+                created = self.ensure_partitions(cur, [now, next_month(now)])
+        self.remember_partitions(created)
+
+    def ensure_partitions(self, cur, timestamps):
+        '''
+        This function creates the missing monthly partitions for the given timestamps in the transaction of cur.
+        Returns the created months, pass them to remember_partitions after the transaction is committed.
+        '''
+        months = {month_start(timestamp) for timestamp in timestamps if isinstance(timestamp, datetime)}
+        with PostgresDB._partitions_lock:
+            missing = sorted(months - PostgresDB._partitions)
+        if not missing:
+            return []
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+        for month in missing:
+            create_partitions(cur, month, month)
+        return missing
+
+    def remember_partitions(self, months):
+        '''
+        This function marks the partitions of committed months as existing, so they are not created again.
+        A rolled back transaction must not call it, otherwise the rows of the month go to the default partition.
+        '''
+        with PostgresDB._partitions_lock:
+            PostgresDB._partitions.update(months)
 
     def insert_aqi(self, country, city, lat, lon, aqi, timestamp=None):
         '''
@@ -46,29 +625,86 @@ class PostgresDB:
         '''
         if timestamp is None:
             timestamp = datetime.utcnow()
+        elif isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
         query = """
         INSERT INTO aqi_data (country, city, lat, lon, aqi, timestamp)
         VALUES (%s, %s, %s, %s, %s, %s);
         """
-        with self.conn.cursor() as cur:
-            cur.execute(query, (country, city, lat, lon, aqi, timestamp))
-            self.conn.commit()
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                created = self.ensure_partitions(cur, [timestamp])
+                cur.execute(query, (country, city, lat, lon, aqi, timestamp))
+                execute_values(cur, UPSERT_LATEST_AQI, [(country, city, lat, lon, aqi, timestamp)])
+        self.remember_partitions(created)
+        invalidate_cache()
+
+    def validate_row(self, row):
+        '''
+        This function checks a row for insert_aqi_bulk.
+        Returns the row as tuple for the insert, or a reason why it is rejected.
+        '''
+        for key in ("country", "city", "lat", "lon", "aqi"):
+            if row.get(key) is None:
+                return None, f"missing {key}"
+        try:
+            aqi = int(row["aqi"])
+            lat = float(row["lat"])
+            lon = float(row["lon"])
+        except (ValueError, TypeError):
+            return None, f"invalid value (aqi={row['aqi']!r}, lat={row['lat']!r}, lon={row['lon']!r})"
+        timestamp = row.get("timestamp") or datetime.utcnow()
+        if isinstance(timestamp, str):
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError:
+                return None, f"invalid timestamp {timestamp!r}"
+        return (row["country"], row["city"], lat, lon, aqi, timestamp), None
+
+    def insert_aqi_bulk(self, rows):
+        '''
+        This function inserts the rows of a whole sweep in one transaction
+        and updates latest_aqi in the same transaction.
+        rows: list of dicts with country, city, lat, lon, aqi and timestamp (optional).
+        Returns a dict with the number of inserted rows and the rejected rows with their reason.
+        '''
+        values = []
+        rejected = []
+        for row in rows:
+            value, reason = self.validate_row(row)
+            if value is None:
+                rejected.append({"row": row, "reason": reason})
+            else:
+                values.append(value)
+
+        if values:
+            query = """
+            INSERT INTO aqi_data (country, city, lat, lon, aqi, timestamp)
+            VALUES %s;
+            """
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    created = self.ensure_partitions(cur, [value[5] for value in values])
+                    execute_values(cur, query, values, page_size=len(values))
+                    execute_values(cur, UPSERT_LATEST_AQI, latest_rows(values), page_size=len(values))
+            self.remember_partitions(created)
+            invalidate_cache()
+        return {"inserted": len(values), "rejected": rejected}
 
     def get_latest_aqi(self):
         '''
-        This function returns the newest aqi data.
+        This function returns the newest aqi data per country.
+        Reads the latest_aqi table, so it does not depend on the size of aqi_data.
         '''
         query = """
-        SELECT country, city, lat, lon, aqi, timestamp
-        FROM (
-            SELECT *, ROW_NUMBER() OVER (PARTITION BY country ORDER BY timestamp DESC) as rn
-            FROM aqi_data
-        ) sub
-        WHERE rn = 1;
+        SELECT DISTINCT ON (country) country, city, lat, lon, aqi, timestamp
+        FROM latest_aqi
+        ORDER BY country, timestamp DESC;
         """
-        with self.conn.cursor() as cur:
-            cur.execute(query)
-            rows = cur.fetchall()
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                rows = cur.fetchall()
         result = {}
         for row in rows:
             country, city, lat, lon, aqi, timestamp = row
@@ -86,31 +722,276 @@ class PostgresDB:
         This function gets all aqi data.
         '''
         query = "SELECT * FROM aqi_data ORDER BY timestamp DESC;"
-        with self.conn.cursor() as cur:
-            cur.execute(query)
-            return cur.fetchall()
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetchall()
 
     def count_entries(self):
         '''
         This function returns the amount of entries in the database.
         '''
         query = "SELECT COUNT(*) FROM aqi_data;"
-        with self.conn.cursor() as cur:
-            cur.execute(query)
-            return cur.fetchone()[0]
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetchone()[0]
 
     def get_latest_aqi_per_city(self):
         '''
         This function returns the newest aqi data for every capital.
-        Uses DISTINCT ON to get only the current entry.
-        '''
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                SELECT DISTINCT ON (country, city)
-                    country, city, lat, lon, aqi, timestamp
-                FROM aqi_data
-                ORDER BY country, city, timestamp DESC
-            """)
-            rows = cur.fetchall()
-            columns = ["country", "city", "lat", "lon", "aqi", "timestamp"]
-            return [dict(zip(columns, row)) for row in rows]
+        Reads the latest_aqi table, which holds one row per capital.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT country, city, lat, lon, aqi, timestamp
+                    FROM latest_aqi
+                    ORDER BY country, city
+                """)
+                rows = cur.fetchall()
+        columns = ["country", "city", "lat", "lon", "aqi", "timestamp"]
+        return [dict(zip(columns, row)) for row in rows]
+
+
+    def get_countries(self):
+        '''
+        This function returns all countries with aqi data (one row per capital in latest_aqi).
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT country FROM latest_aqi ORDER BY country;")
+                return [row[0] for row in cur.fetchall()]
+
+    def get_cities(self, country=None):
+        '''
+        This function returns all capitals with aqi data, optionally of one country.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT DISTINCT city FROM latest_aqi WHERE %s IS NULL OR country = %s ORDER BY city;",
+                    (country, country)
+                )
+                return [row[0] for row in cur.fetchall()]
+
+    def iter_history(self, city=None, country=None, since=None, until=None,
+                     columns=("timestamp", "aqi"), resolution="raw", chunk_size=HISTORY_CHUNK_SIZE):
+        '''
+        This function streams the aqi history in chunks of rows with a server-side cursor.
+        The country, city and time filters and the column selection run in SQL.
+        columns: names out of country, city, lat, lon, timestamp, aqi, aqi_min, aqi_max.
+        The query is routed to the coarsest table which answers the time range in the requested
+        resolution, aggregated tables return the mean aqi of the hour or day.
+        '''
+        if since is None:
+            entry = HISTORY_TABLES[RESOLUTIONS.index(resolution)]
+        else:
+            entry = history_table((datetime.now() - since) / timedelta(days=1), resolution)
+        table = entry[1]
+        mapping = history_columns(entry)
+        unknown = [column for column in columns if column not in mapping]
+        if unknown:
+            raise ValueError(f"Unknown history columns: {unknown}")
+        time_col = mapping["timestamp"]
+        select = ", ".join(f"{mapping[column]} AS {column}" for column in columns)
+        query = f"""
+            SELECT {select} FROM {table}
+            WHERE (%(city)s IS NULL OR city = %(city)s)
+            AND (%(country)s IS NULL OR country = %(country)s)
+            AND (%(since)s IS NULL OR {time_col} >= %(since)s)
+            AND (%(until)s IS NULL OR {time_col} < %(until)s)
+            ORDER BY {time_col} ASC
+        """
+        params = {"city": city, "country": country, "since": since, "until": until}
+        with self.connection() as conn:
+            with conn.cursor(name=f"aqi_history_{uuid.uuid4().hex}") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    def get_history(self, city, days, country=None, resolution="raw"):
+        '''
+        This function returns (timestamp, aqi) of a capital for the last days in ascending order.
+        '''
+        since = datetime.now() - timedelta(days=days)
+        chunks = self.iter_history(city=city, country=country, since=since, resolution=resolution)
+        return [row for chunk in chunks for row in chunk]
+
+    def upsert_forecasts(self, rows):
+        '''
+        This function saves precomputed forecasts in one transaction.
+        rows: list of (city, ds, yhat, yhat_lower, yhat_upper).
+        The cached queries are not invalidated, callers saving a batch call invalidate_cache once at the end.
+        '''
+        if not rows:
+            return 0
+        query = """
+        INSERT INTO forecasts (city, ds, yhat, yhat_lower, yhat_upper)
+        VALUES %s
+        ON CONFLICT (city, ds) DO UPDATE SET
+            yhat = EXCLUDED.yhat,
+            yhat_lower = EXCLUDED.yhat_lower,
+            yhat_upper = EXCLUDED.yhat_upper,
+            generated_at = NOW();
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, query, rows, page_size=5000)
+        return len(rows)
+
+    def delete_forecasts_before(self, timestamp):
+        '''
+        This function removes forecasts for hours before timestamp.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM forecasts WHERE ds < %s;", (timestamp,))
+                return cur.rowcount
+
+    def request_sweep(self, source):
+        '''
+        This function queues a sweep for the ingest worker and wakes it up.
+        If a sweep is already queued or running, no new one is queued.
+        Returns the id of the queued or running sweep, or None if it could not be queued.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self._fail_dead_sweeps(cur)
+                # the active sweep can finish between the insert and the select, then the insert is tried again
+                for _ in range(3):
+                    cur.execute("""
+                        INSERT INTO sweep_requests (source) VALUES (%s)
+                        ON CONFLICT DO NOTHING
+                        RETURNING id;
+                    """, (source,))
+                    row = cur.fetchone()
+                    if row is None:
+                        cur.execute("SELECT id FROM sweep_requests WHERE status IN ('queued', 'running');")
+                        row = cur.fetchone()
+                    if row is not None:
+                        cur.execute(f"NOTIFY {SWEEP_REQUEST_CHANNEL};")
+                        return row[0]
+        return None
+
+    def claim_sweep(self):
+        '''
+        This function marks the queued sweep as running. Returns its id or None, if no sweep is queued.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                self._fail_dead_sweeps(cur)
+                cur.execute("""
+                    UPDATE sweep_requests SET status = 'running', started_at = NOW()
+                    WHERE id = (
+                        SELECT id FROM sweep_requests WHERE status = 'queued'
+                        ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id;
+                """)
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def _fail_dead_sweeps(self, cur):
+        cur.execute("""
+            UPDATE sweep_requests SET status = 'failed', finished_at = NOW(), error = 'worker stopped'
+            WHERE status = 'running' AND COALESCE(updated_at, started_at) < NOW() - %s * INTERVAL '1 minute';
+        """, (SWEEP_TIMEOUT_MINUTES,))
+
+    def update_sweep_progress(self, sweep_id, done, total):
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE sweep_requests SET done = %s, total = %s, updated_at = NOW() WHERE id = %s;",
+                    (done, total, sweep_id)
+                )
+
+    def finish_sweep(self, sweep_id, inserted=None, rejected=None, error=None):
+        '''
+        This function marks a sweep as done, or as failed if an error is given.
+        A done sweep is published on SWEEP_DONE_CHANNEL, delivered together with the commit.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE sweep_requests
+                    SET status = %s, updated_at = NOW(), finished_at = NOW(), inserted = %s, rejected = %s, error = %s
+                    WHERE id = %s;
+                """, ("failed" if error else "done", inserted, rejected, error, sweep_id))
+                if not error:
+                    cur.execute("SELECT pg_notify(%s, %s);", (SWEEP_DONE_CHANNEL, str(sweep_id)))
+
+    def get_sweep(self, sweep_id):
+        '''
+        This function returns the state of a sweep as dict or None.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {', '.join(SWEEP_COLUMNS)} FROM sweep_requests WHERE id = %s;", (sweep_id,))
+                row = cur.fetchone()
+        return dict(zip(SWEEP_COLUMNS, row)) if row else None
+
+    def get_forecast(self, city, ds):
+        '''
+        This function returns the precomputed forecast of a capital for an hour or None.
+        '''
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT ds, yhat, yhat_lower, yhat_upper, generated_at FROM forecasts WHERE city = %s AND ds = %s;",
+                    (city, ds)
+                )
+                row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip(["ds", "yhat", "yhat_lower", "yhat_upper", "generated_at"], row))
+
+    def rollup_and_compact(self, raw_retention_days=RAW_RETENTION_DAYS, hourly_retention_days=HOURLY_RETENTION_DAYS):
+        '''
+        This function compacts the aqi history in one transaction:
+        raw readings are aggregated into hourly and hourly into daily min/mean/max values,
+        then raw readings older than raw_retention_days and hourly aggregates older than
+        hourly_retention_days are removed. Whole monthly partitions are dropped if possible.
+        Returns the number of removed raw and hourly rows.
+        '''
+        raw_cutoff = datetime.now() - timedelta(days=raw_retention_days)
+        hourly_cutoff = datetime.now() - timedelta(days=hourly_retention_days)
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(ROLLUP_HOURLY)
+                cur.execute(ROLLUP_DAILY)
+
+                cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+                dropped = []
+                for name, month in list_partitions(cur).items():
+                    if next_month(month) <= raw_cutoff:
+                        cur.execute(f"DROP TABLE {name};")
+                        dropped.append(month)
+                cur.execute("DELETE FROM aqi_data WHERE timestamp < %s;", (raw_cutoff,))
+                raw_deleted = cur.rowcount
+                cur.execute("DELETE FROM aqi_hourly WHERE bucket < %s;", (hourly_cutoff,))
+                hourly_deleted = cur.rowcount
+        with PostgresDB._partitions_lock:
+            PostgresDB._partitions.difference_update(dropped)
+        invalidate_cache()
+        if dropped:
+            print(f"Dropped {len(dropped)} raw partitions older than {raw_cutoff:%Y-%m-%d}.")
+        return {"raw_deleted": raw_deleted, "hourly_deleted": hourly_deleted, "partitions_dropped": len(dropped)}
+
+
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    '''
+    This function returns the process-wide database handle.
+    '''
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = PostgresDB()
+        return _db
@@ -8,25 +8,197 @@ import sys
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(BASE_DIR))
 
-import schedule
-import time
-from backend.api import fetch_and_store_aqi_for_all_countries
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from backend.data.new_database import get_db, AdvisoryLock
+from backend.data.jobs import JobRecorder, JobWorker
+
+load_dotenv()
+
+# the capitals are requested every 15 minutes (at :00, :15, :30 and :45)
+INGEST_INTERVAL_MINUTES = 15
+
+# daily times of the background jobs (HH:MM), retraining before the evaluation
+TRAIN_AT = os.getenv("TRAIN_AT", "02:00")
+EVALUATE_AT = os.getenv("EVALUATE_AT", "04:00")
+
+# only the process holding this advisory lock runs the jobs of the deployment,
+# the other processes try to take over every SCHEDULER_STANDBY_SECONDS
+SCHEDULER_LOCK = os.getenv("SCHEDULER_LOCK", "1") == "1"
+SCHEDULER_LOCK_KEY = 4711002
+SCHEDULER_STANDBY_SECONDS = float(os.getenv("SCHEDULER_STANDBY_SECONDS", "60"))
+
+# runtimes, overlaps and missed runs of all jobs of this process
+recorder = JobRecorder()
+
+
+def every_minutes(minutes):
+    '''
+    This function returns the due times of a job every minutes, aligned to the full hour.
+    '''
+    def next_due(after):
+        start = after.replace(minute=0, second=0, microsecond=0)
+        steps = int((after - start) / timedelta(minutes=minutes)) + 1
+        return start + steps * timedelta(minutes=minutes)
+    return next_due
+
+def daily_at(at):
+    '''
+    This function returns the due times of a job once a day at HH:MM.
+    '''
+    hour, minute = (int(part) for part in at.split(":"))
+    def next_due(after):
+        due = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return due if due > after else due + timedelta(days=1)
+    return next_due
+
+
+class ScheduledJob:
+    '''
+    A job of the scheduler. next_due returns the first due time after a time.
+    track: records the runs, jobs which only hand over to the job worker are recorded there.
+    '''
+    def __init__(self, name, next_due, run, track=True):
+        self.name = name
+        self.next_due = next_due
+        self.run = run
+        self.track = track
+        self.due = None
+
+
+class Scheduler:
+    '''
+    This class runs jobs at their due times. The thread sleeps until the next job is due instead of polling.
+    If a job is due several times while the scheduler is busy or asleep, it runs once and the other runs are recorded as missed.
+    With a lock, only the process holding it runs the jobs, the others wait in standby.
+    After taking over, the due times start from the takeover, the runs of the previous leader are not missed.
+    clock: returns the current time, datetime.now by default.
+    '''
+    def __init__(self, jobs, recorder, lock=None, standby_seconds=SCHEDULER_STANDBY_SECONDS, clock=datetime.now):
+        self.jobs = jobs
+        self.recorder = recorder
+        self.lock = lock
+        self.standby_seconds = standby_seconds
+        self.clock = clock
+        self.leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.lock is not None:
+            self.lock.release()
+
+    def join(self):
+        self._thread.join()
+
+    def is_leader(self):
+        '''
+        This function checks whether this process may run the jobs and tries to take over the lock, if not.
+        When it becomes the leader, the due times are computed from now on.
+        '''
+        if self.lock is None:
+            leader = True
+        else:
+            try:
+                leader = self.lock.held() or self.lock.acquire()
+            except Exception as e:
+                print(f"Scheduler lock can not be checked: {e}")
+                leader = False
+        if leader != self.leader:
+            if leader:
+                self.reset_due()
+            if self.lock is not None:
+                print("Scheduler runs the jobs of this deployment." if leader else "Scheduler is in standby, another process runs the jobs.")
+            self.leader = leader
+        return leader
+
+    def reset_due(self):
+        now = self.clock()
+        for job in self.jobs:
+            job.due = job.next_due(now)
+
+    def run(self):
+        print("Scheduler is running.")
+        while not self._stop.is_set():
+            if not self.is_leader():
+                self._stop.wait(self.standby_seconds)
+                continue
+            job = min(self.jobs, key=lambda job: job.due)
+            wait = (job.due - self.clock()).total_seconds()
+            if wait > 0:
+                # the lock is checked again after waking up
+                self._stop.wait(wait)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        due = job.due
+        try:
+            if job.track:
+                with self.recorder.track(job.name):
+                    job.run()
+            else:
+                job.run()
+        except Exception as e:
+            print(f"Job {job.name} failed: {e}")
+        # due times which passed during the run or while sleeping are missed, the next one is in the future
+        now = self.clock()
+        missed = 0
+        job.due = job.next_due(due)
+        while job.due <= now:
+            missed += 1
+            job.due = job.next_due(job.due)
+        if missed:
+            self.recorder.missed(job.name, missed, due)
+        return missed
+
+
+def ingest():
+    '''
+    This function queues a sweep, the ingest worker runs it and records it as job ingest.
+    '''
+    sweep_id = get_db().request_sweep("schedule")
+    print(f"Automatic request for aqi-values queued (sweep {sweep_id}).")
+
+def create_scheduler():
+    '''
+    This function creates the scheduler of the ingestion every 15 minutes and of the daily retraining and evaluation.
+    The sweeps are only queued, the ingest worker runs them (python -m backend.ingest).
+    Retraining and evaluation run in a separate worker, so they never delay a request.
+    '''
+    worker = JobWorker(recorder).start()
+    jobs = [
+        ScheduledJob("ingest", every_minutes(INGEST_INTERVAL_MINUTES), ingest, track=False),
+        ScheduledJob("train", daily_at(TRAIN_AT), lambda: worker.submit("train"), track=False),
+        ScheduledJob("evaluate", daily_at(EVALUATE_AT), lambda: worker.submit("evaluate"), track=False),
+    ]
+    return Scheduler(jobs, recorder, lock=AdvisoryLock(SCHEDULER_LOCK_KEY) if SCHEDULER_LOCK else None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
 
 def start_scheduler():
     '''
-    This function starts an automatic request of capitals by period.
-    The requests are every 15 minutes.
+    This function starts the scheduler in a background thread, once per process.
+    Later calls return the running scheduler.
     '''
-    def job():
-        print("Starting automatic request for aqi-values ...")
-        fetch_and_store_aqi_for_all_countries()
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = create_scheduler().start()
+        return _scheduler
 
-    schedule.every().hour.at(":00").do(job) # == 15:00 for example
-    schedule.every().hour.at(":15").do(job) # == 15:15
-    schedule.every().hour.at(":30").do(job) # == 15:30
-    schedule.every().hour.at(":45").do(job) # == 15:45
 
-    print("Scheduler is running. Click Strg+C to stop.")
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+if __name__ == "__main__":
+    # the queued sweeps are run by the ingest worker, which also starts the scheduler
+    from backend.ingest import main
+    main()
@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# size of the keep-alive connection pool for every host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# timeout of a single request in seconds
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+
+# retries after a failed request, waiting with jittered exponential backoff
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+# maximum number of requests per second for every host (0 = unlimited)
+WAQI_RATE_LIMIT = float(os.getenv("WAQI_RATE_LIMIT", "10"))
+
+# failed requests in a row until a host is blocked, and how long it stays blocked
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+# status codes which are worth a retry
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    '''
+    Raised when a host is blocked by its circuit breaker.
+    '''
+
+
+class HostRateLimiter:
+    '''
+    This class limits the requests per second for every host.
+    Every caller gets the next free time slot of its host and sleeps until it is reached.
+    '''
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        '''
+        This function blocks until a request to the host of the url is allowed.
+        '''
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    '''
+    This class stops requests to a host after too many failures in a row.
+    States: closed (requests pass), open (requests are blocked) and
+    half-open (after the reset time a single trial request decides about closing again).
+    '''
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        '''
+        This function returns True, if a request may be sent.
+        '''
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    print(f"Circuit breaker opened after {self.failures} failures.")
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class HTTPClient:
+    '''
+    This class is the shared HTTP client of the app.
+    It keeps a pooled keep-alive session and protects every host with
+    a rate limiter, retries with jittered exponential backoff and a circuit breaker.
+    '''
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES,
+                 backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX, rate_limit=WAQI_RATE_LIMIT):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = HostRateLimiter(rate_limit)
+        self.session = requests.Session()
+        # retries are done by the client itself, so the adapter does not retry
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        '''
+        This function returns the circuit breaker of the host of the url.
+        '''
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker()
+            return self._breakers[host]
+
+    def backoff(self, attempt):
+        '''
+        This function returns the waiting time before the next retry (full jitter).
+        '''
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def get(self, url, timeout=None):
+        '''
+        This function sends a GET request and retries it on connection errors,
+        timeouts and retryable status codes.
+        Raises CircuitOpenError if the host is blocked, otherwise the last error.
+        '''
+        breaker = self.breaker(url)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Requests to {urlparse(url).netloc} are paused after repeated failures.")
+            self.rate_limiter.wait(url)
+            try:
+                res = self.session.get(url, timeout=timeout or self.timeout)
+                if res.status_code in RETRY_STATUS_CODES:
+                    raise requests.HTTPError(f"{res.status_code} for {urlparse(url).path}", response=res)
+                res.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = e.response is None or e.response.status_code in RETRY_STATUS_CODES
+                if not retryable:
+                    # the host answered, so it is not an outage
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+            else:
+                breaker.record_success()
+                return res
+
+    def get_json(self, url, timeout=None):
+        '''
+        This function sends a GET request and returns the decoded JSON body.
+        '''
+        return self.get(url, timeout=timeout).json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    '''
+    This function returns the process-wide HTTP client, which is created on first use.
+    '''
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
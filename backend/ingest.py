@@ -0,0 +1,112 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import threading
+from dotenv import load_dotenv
+from backend.api import fetch_and_store_aqi_for_all_countries
+from backend.data.new_database import get_db, NotificationListener, SWEEP_REQUEST_CHANNEL
+from backend.data.scheduler import start_scheduler, recorder
+
+load_dotenv()
+
+# the queue is checked at least this often, also if a notification got lost (seconds)
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "60"))
+# the progress of a running sweep is written at most this often (seconds)
+PROGRESS_INTERVAL_SECONDS = float(os.getenv("PROGRESS_INTERVAL_SECONDS", "1"))
+# attempts to mark a sweep as finished, with 1, 2, 4 ... seconds in between
+FINISH_ATTEMPTS = 3
+# wait before the listener connects again after the database was not reachable (seconds)
+RECONNECT_SECONDS = 10
+
+# only one thread of the process runs sweeps
+_sweep_lock = threading.Lock()
+
+
+def run_sweep(sweep_id):
+    '''
+    This function runs a claimed sweep: fetches and stores the aqi values of all capitals,
+    rolls up the history and marks the sweep as done or failed. The progress is written to the sweep row.
+    '''
+    db = get_db()
+    last_write = [0.0]
+
+    def on_progress(done, total):
+        now = time.monotonic()
+        if done == total or now - last_write[0] >= PROGRESS_INTERVAL_SECONDS:
+            last_write[0] = now
+            try:
+                db.update_sweep_progress(sweep_id, done, total)
+            except Exception as e:
+                print(f"Progress of sweep {sweep_id} can not be saved: {e}")
+
+    print(f"Starting sweep {sweep_id} ...")
+    try:
+        with recorder.track("ingest"):
+            report = fetch_and_store_aqi_for_all_countries(on_progress=on_progress)
+    except Exception as e:
+        print(f"Sweep {sweep_id} failed: {e}")
+        finish_sweep(db, sweep_id, error=str(e) or type(e).__name__)
+        return None
+    try:
+        db.rollup_and_compact()
+    except Exception as e:
+        print(f"Rollup of the aqi history failed: {e}")
+    finish_sweep(db, sweep_id, inserted=report["inserted"], rejected=len(report["rejected"]))
+    return report
+
+def finish_sweep(db, sweep_id, attempts=FINISH_ATTEMPTS, **result):
+    '''
+    This function marks a sweep as finished and tries again, if the database is not reachable.
+    If all attempts fail, the sweep is failed after SWEEP_TIMEOUT_MINUTES by the next request or claim.
+    '''
+    for attempt in range(attempts):
+        try:
+            db.finish_sweep(sweep_id, **result)
+            return True
+        except Exception as e:
+            print(f"Sweep {sweep_id} can not be marked as finished (attempt {attempt + 1}/{attempts}): {e}")
+            if attempt + 1 < attempts:
+                time.sleep(2 ** attempt)
+    return False
+
+def process_requests():
+    '''
+    This function runs all queued sweeps one after another. Returns the number of sweeps which were run.
+    '''
+    count = 0
+    with _sweep_lock:
+        while True:
+            sweep_id = get_db().claim_sweep()
+            if sweep_id is None:
+                return count
+            run_sweep(sweep_id)
+            count += 1
+
+def create_listener():
+    '''
+    This function creates the listener which runs the sweeps, when a request is notified.
+    The queue is also checked after connecting and every INGEST_POLL_SECONDS, so no request is lost without a notification.
+    '''
+    return NotificationListener(
+        [SWEEP_REQUEST_CHANNEL],
+        on_notify=lambda notify: process_requests(),
+        on_connect=process_requests,
+        on_timeout=process_requests,
+        poll_seconds=INGEST_POLL_SECONDS,
+        reconnect_seconds=RECONNECT_SECONDS
+    )
+
+def main():
+    '''
+    This function runs the ingest worker: the scheduler queues a sweep every 15 minutes and the daily jobs,
+    the listener runs the sweeps which are queued by the scheduler or by the Update button of the app.
+    '''
+    print("Click Strg+C to stop.")
+    start_scheduler()
+    create_listener().run()
+
+
+if __name__ == "__main__":
+    main()
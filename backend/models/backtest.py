@@ -0,0 +1,223 @@
+import os
+import time
+import hashlib
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from backend.models.model_store import MODEL_DIR
+from backend.models.model import fit_model, warm_start_params
+from backend.models.forecasters import HourOfDayForecaster
+
+load_dotenv()
+
+# forecast horizons in hours, which are evaluated for every cutoff
+BACKTEST_HORIZONS = [int(h) for h in os.getenv("BACKTEST_HORIZONS", "1,3,6,12,24,48").split(",")]
+# hours between two cutoffs
+BACKTEST_STEP_HOURS = int(os.getenv("BACKTEST_STEP_HOURS", "6"))
+# days before a cutoff on which the models are refitted, a fixed window keeps the cached predictions valid
+BACKTEST_TRAIN_DAYS = int(os.getenv("BACKTEST_TRAIN_DAYS", "21"))
+# an actual value counts for a target hour, if it was measured at most this far away
+MATCH_TOLERANCE = np.timedelta64(30, "m")
+
+CACHE_DIR = MODEL_DIR / "backtest_cache"
+
+HOUR = np.timedelta64(1, "h")
+
+
+def rolling_cutoffs(ds, start, horizons, step_hours=BACKTEST_STEP_HOURS):
+    '''
+    This function returns the cutoffs of the rolling-origin evaluation:
+    every step_hours full hours from start on, as long as the shortest horizon is still covered by the data.
+    '''
+    if len(ds) == 0:
+        return np.array([], dtype="datetime64[ns]")
+    first = np.datetime64(pd.Timestamp(start).ceil("h"), "ns")
+    last = ds.max() - min(horizons) * HOUR
+    if last < first:
+        return np.array([], dtype="datetime64[ns]")
+    return np.arange(first, last + np.timedelta64(1, "ns"), step_hours * HOUR).astype("datetime64[ns]")
+
+def target_times(cutoffs, horizons):
+    '''
+    This function returns the target hours of all cutoffs, shape (cutoffs, horizons).
+    '''
+    return cutoffs[:, None] + np.asarray(horizons)[None, :] * HOUR
+
+def match_actuals(ds, y, targets, tolerance=MATCH_TOLERANCE):
+    '''
+    This function looks up the measured value nearest to every target time.
+    ds must be sorted. Targets without a measurement within tolerance get NaN.
+    '''
+    flat = targets.ravel()
+    if len(ds) == 0:
+        return np.full(targets.shape, np.nan)
+    right = np.clip(np.searchsorted(ds, flat), 0, len(ds) - 1)
+    left = np.clip(right - 1, 0, len(ds) - 1)
+    nearest = np.where(np.abs(ds[left] - flat) <= np.abs(ds[right] - flat), left, right)
+    actuals = y[nearest].astype(np.float64)
+    actuals[np.abs(ds[nearest] - flat) > tolerance] = np.nan
+    return actuals.reshape(targets.shape)
+
+def training_windows(ds, cutoffs, train_days=BACKTEST_TRAIN_DAYS):
+    '''
+    This function returns the index range [start, end) of the training data of every cutoff:
+    the values measured in the train_days before the cutoff, including the cutoff. ds must be sorted.
+    '''
+    starts = np.searchsorted(ds, cutoffs - np.timedelta64(train_days, "D"), side="right")
+    ends = np.searchsorted(ds, cutoffs, side="right")
+    return starts, ends
+
+def window_key(ds, y):
+    '''
+    This function returns a hash of the training data of a cutoff, which changes whenever the data changes.
+    '''
+    digest = hashlib.sha1()
+    digest.update(np.asarray(ds, dtype="datetime64[ns]").tobytes())
+    digest.update(np.asarray(y, dtype=np.float64).tobytes())
+    return f"{len(ds)}-{digest.hexdigest()}"
+
+def refit_cutoffs(model, ds, y, cutoffs, windows, horizons):
+    '''
+    This function refits Prophet at every cutoff on its training window and predicts the hours of every horizon after it.
+    Every fit is warm-started from the previous one, the first from the saved model.
+    Cutoffs with too little training data or a failed fit get NaN. Returns the predictions, shape (cutoffs, horizons).
+    '''
+    predictions = np.full((len(cutoffs), len(horizons)), np.nan)
+    targets = target_times(cutoffs, horizons)
+    previous = model
+    for i, (start, end) in enumerate(zip(*windows)):
+        try:
+            init = warm_start_params(previous) if previous is not None else None
+        except Exception:
+            init = None
+        train_df = pd.DataFrame({"ds": ds[start:end], "y": y[start:end].astype(np.float64)})
+        try:
+            fitted = fit_model(train_df, init=init)
+        except (ValueError, RuntimeError) as e:
+            # too little data or the optimizer of Stan did not converge on this window
+            print(f"Refit at cutoff {pd.Timestamp(cutoffs[i])} failed, skip: {e}")
+            continue
+        predictions[i] = fitted.predict(pd.DataFrame({"ds": targets[i]}))["yhat"].to_numpy()
+        previous = fitted
+    return predictions
+
+def baseline_cutoffs(ds, y, cutoffs, windows, horizons):
+    '''
+    This function refits the hour-of-day baseline at every cutoff on its training window, all cutoffs in one batched pass.
+    Cutoffs without training data get NaN. Returns the predictions, shape (cutoffs, horizons).
+    '''
+    predictions = np.full((len(cutoffs), len(horizons)), np.nan)
+    baselines = HourOfDayForecaster.fit_batch({i: (ds[start:end], y[start:end]) for i, (start, end) in enumerate(zip(*windows))})
+    targets = target_times(cutoffs, horizons)
+    for i, baseline in baselines.items():
+        predictions[i] = baseline.predict(targets[i])
+    return predictions
+
+def horizon_errors(predictions, actuals):
+    '''
+    This function calculates MAE and RMSE of every horizon over all cutoffs at once.
+    Target hours without a measurement are left out.
+    '''
+    errors = predictions - actuals
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mae = np.nanmean(np.abs(errors), axis=0)
+        rmse = np.sqrt(np.nanmean(errors ** 2, axis=0))
+    return mae, rmse, np.sum(~np.isnan(errors), axis=0)
+
+
+class PredictionCache:
+    '''
+    This class stores the backtest predictions of every capital on disk, keyed by the cutoff
+    and the hash of the training window of the cutoff.
+    Repeated backtests only refit cutoffs which are new or whose training data changed.
+    The predictions of a capital are dropped, if the horizons changed.
+    '''
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def path(self, city):
+        return self.cache_dir / f"{city}.npz"
+
+    def load(self, city, horizons):
+        '''
+        This function returns the cached predictions of a capital as {cutoff: (window key, predictions)}.
+        '''
+        path = self.path(city)
+        if not path.exists():
+            return {}
+        with np.load(path, allow_pickle=False) as data:
+            if "keys" not in data or data["horizons"].tolist() != list(horizons):
+                return {}
+            return {
+                cutoff: (str(key), predictions)
+                for cutoff, key, predictions in zip(data["cutoffs"].tolist(), data["keys"], data["predictions"])
+            }
+
+    def save(self, city, horizons, predictions):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cutoffs = sorted(predictions)
+        tmp_path = self.path(city).with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            horizons=np.array(horizons),
+            cutoffs=np.array(cutoffs, dtype=np.int64),
+            keys=np.array([predictions[c][0] for c in cutoffs], dtype=str),
+            predictions=np.array([predictions[c][1] for c in cutoffs]).reshape(len(cutoffs), len(horizons))
+        )
+        os.replace(tmp_path, self.path(city))
+
+
+def backtest_city(city_name, model, ds, y, start, cache,
+                  horizons=BACKTEST_HORIZONS, step_hours=BACKTEST_STEP_HOURS, train_days=BACKTEST_TRAIN_DAYS):
+    '''
+    This function runs the rolling-origin evaluation of one capital: at every cutoff after start,
+    Prophet and the hour-of-day baseline are refitted on the train_days before the cutoff
+    and the hours of every horizon after the cutoff are compared with the measured values.
+    model: the saved Prophet model, the first refit is warm-started from it.
+    ds, y: the arrays of the capital out of load_all_city_data.
+    Returns the MAE/RMSE per horizon of both models, the number of cutoffs and the runtime.
+    '''
+    started = time.perf_counter()
+    ds, y = np.asarray(ds, dtype="datetime64[ns]"), np.asarray(y)
+    order = np.argsort(ds, kind="stable")
+    ds, y = ds[order], y[order]
+    cutoffs = rolling_cutoffs(ds, start, horizons, step_hours)
+    windows = training_windows(ds, cutoffs, train_days)
+    keys = [window_key(ds[s:e], y[s:e]) for s, e in zip(*windows)]
+
+    cached = cache.load(city_name, horizons)
+    predictions = {}
+    missing = []
+    for i, cutoff in enumerate(cutoffs.astype(np.int64).tolist()):
+        if cutoff in cached and cached[cutoff][0] == keys[i]:
+            predictions[cutoff] = cached[cutoff]
+        else:
+            missing.append(i)
+    if missing:
+        missing_windows = (windows[0][missing], windows[1][missing])
+        new = refit_cutoffs(model, ds, y, cutoffs[missing], missing_windows, horizons)
+        for i, row in zip(missing, new):
+            predictions[int(cutoffs[i].astype(np.int64))] = (keys[i], row)
+        cache.save(city_name, horizons, predictions)
+
+    result = {
+        "cutoffs": len(cutoffs),
+        "cached_cutoffs": len(cutoffs) - len(missing)
+    }
+    if len(cutoffs):
+        matrix = np.array([predictions[key][1] for key in cutoffs.astype(np.int64).tolist()])
+        baseline = baseline_cutoffs(ds, y, cutoffs, windows, horizons)
+        actuals = match_actuals(ds, y, target_times(cutoffs, horizons))
+        mae, rmse, _ = horizon_errors(matrix, actuals)
+        baseline_mae, baseline_rmse, _ = horizon_errors(baseline, actuals)
+        for i, h in enumerate(horizons):
+            result[f"MAE_{h}h"] = round(float(mae[i]), 2)
+            result[f"RMSE_{h}h"] = round(float(rmse[i]), 2)
+            result[f"baseline_MAE_{h}h"] = round(float(baseline_mae[i]), 2)
+            result[f"baseline_RMSE_{h}h"] = round(float(baseline_rmse[i]), 2)
+    result["backtest_s"] = round(time.perf_counter() - started, 4)
+    return result
@@ -0,0 +1,80 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import time
+import argparse
+import pandas as pd
+
+from backend.capitals_data import get_capitals
+from backend.models.model import load_all_city_data, city_frame, split_train_eval, fit_model, forecast, horizon_timestamps
+
+HOURS_AHEAD = 7 * 24
+
+def time_call(func, repeats):
+    '''
+    This function returns the median runtime of a call in seconds.
+    '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+def benchmark_city(df, hours_ahead, repeats):
+    '''
+    This function fits the model of one capital once and compares the prediction time of
+    the old path (history plus horizon) with the prediction of only the horizon and of only one hour.
+    '''
+    train_df, _ = split_train_eval(df)
+    start = time.perf_counter()
+    model = fit_model(train_df)
+    fit_time = time.perf_counter() - start
+    horizon = horizon_timestamps(train_df['ds'].max(), hours_ahead)
+    return {
+        "rows": len(train_df),
+        "fit_s": fit_time,
+        "history_and_horizon_s": time_call(
+            lambda: model.predict(model.make_future_dataframe(periods=hours_ahead, freq='h')), repeats),
+        "horizon_s": time_call(lambda: forecast(model, horizon), repeats),
+        "one_hour_s": time_call(lambda: forecast(model, horizon[-1:]), repeats)
+    }
+
+def main():
+    '''
+    This function measures per capital how much time predicting only the requested points saves.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark of forecasting only the horizon instead of history plus horizon.")
+    parser.add_argument("--limit", type=int, default=None, help="number of capitals (default: all)")
+    parser.add_argument("--hours", type=int, default=HOURS_AHEAD, help="forecast horizon in hours")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats per prediction")
+    args = parser.parse_args()
+
+    city_data = load_all_city_data()
+    cities = [city_entry["city"] for city_entry in get_capitals() if city_entry["city"] in city_data][:args.limit]
+    results = []
+    for city_name in cities:
+        df = city_frame(city_data[city_name])
+        if len(df) < 20:
+            continue
+        result = benchmark_city(df, args.hours, args.repeats)
+        result["city"] = city_name
+        result["saved_s"] = result["history_and_horizon_s"] - result["horizon_s"]
+        results.append(result)
+        print(f"{city_name:25} {result['rows']:6} rows  fit {result['fit_s']:6.2f}s  "
+              f"history+horizon {result['history_and_horizon_s']:6.3f}s  horizon {result['horizon_s']:6.3f}s  "
+              f"one hour {result['one_hour_s']:6.3f}s")
+
+    if not results:
+        print("No capital with enough data.")
+        return
+    df = pd.DataFrame(results)
+    print(f"\n{len(df)} capitals, {args.hours} hours ahead:")
+    print(f"  history+horizon predict: {df['history_and_horizon_s'].sum():.1f}s total, {df['history_and_horizon_s'].mean():.3f}s per capital")
+    print(f"  horizon-only predict:    {df['horizon_s'].sum():.1f}s total, {df['horizon_s'].mean():.3f}s per capital")
+    print(f"  one-hour predict:        {df['one_hour_s'].sum():.1f}s total, {df['one_hour_s'].mean():.3f}s per capital")
+    print(f"  saved per capital:       {df['saved_s'].mean():.3f}s (median {df['saved_s'].median():.3f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,18 @@
 import sys
 import os
-import json
+import time
+import argparse
 from pathlib import Path
-import joblib
 import pandas as pd
 import numpy as np
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from backend.models.model import load_city_data_from_postgres
+from backend.models.model import load_all_city_data, city_frame
+from backend.models.forecasters import HourOfDayForecaster
+from backend.models.backtest import PredictionCache, backtest_city, BACKTEST_HORIZONS, BACKTEST_STEP_HOURS
+from backend.models.registry import get_registry
 from backend.capitals_data import get_capitals
 
 def find_time_and_target_column(df):
@@ -32,26 +35,56 @@ def find_time_and_target_column(df):
 
     return time_col, target_col
 
-def evaluate_model(city_name, model_dir, results):
+def load_split_points(store, cities):
+    '''
+    This function reads the split points of the saved models out of the manifest of the model store.
+    Returns {city: split_point}.
+    '''
+    split_points = {}
+    for city_name in cities:
+        entry = store.entry(city_name)
+        if entry is not None and entry.get("split_point"):
+            split_points[city_name] = np.datetime64(pd.to_datetime(entry["split_point"]), "ns")
+    return split_points
+
+def fit_baselines(city_data, split_points):
+    '''
+    This function fits the hour-of-day baseline of all capitals in one batched pass,
+    every capital only on its data before the split point of its Prophet model.
+    Returns the baselines and the fit time per capital.
+    '''
+    train_data = {}
+    for city_name, split_point in split_points.items():
+        if city_name in city_data:
+            ds, y = city_data[city_name]
+            train_data[city_name] = (ds[ds < split_point], y[ds < split_point])
+    start = time.perf_counter()
+    baselines = HourOfDayForecaster.fit_batch(train_data)
+    fit_time = (time.perf_counter() - start) / max(len(baselines), 1)
+    return baselines, fit_time
+
+def evaluate_model(city_name, registry, results, arrays=None, baseline=None, baseline_fit_s=None, backtest=None):
     '''
     This function does a prediction based on evaluation data. 
     It also calculates the MAE and RMSE.
+    registry: the model registry, which loads the models of the model store.
+    arrays: (ds, y) arrays of the capital out of load_all_city_data.
+    baseline: fitted HourOfDayForecaster, which is evaluated on the same data and compared with Prophet.
+    backtest: options of the rolling-origin evaluation (cache, horizons, step_hours), adds the errors per horizon
+    of Prophet and the baseline, both refitted at every cutoff.
     '''
-    model_path = model_dir / f"{city_name}_prophet.pkl"
-    split_path = model_dir / f"{city_name}_split.json"
-    if not (model_path.exists() and split_path.exists()):
+    started = time.perf_counter()
+    # loading model and split info (cached by the registry)
+    try:
+        model, split_info = registry.get_with_entry(city_name)
+    except FileNotFoundError:
+        split_info = {}
+    if not split_info.get("split_point"):
         print(f"No model or split point is found for {city_name}, skip.")
         return
-
-    # loading model
-    model = joblib.load(model_path)
-
-    # loading split info
-    with open(split_path) as f:
-        split_info = json.load(f)
     split_point = pd.to_datetime(split_info["split_point"])
 
-    df = load_city_data_from_postgres(city_name, days=30)
+    df = city_frame(arrays)
     try:
         time_col, target_col = find_time_and_target_column(df)
     except ValueError as e:
@@ -66,7 +99,9 @@ def evaluate_model(city_name, model_dir, results):
         return
 
     future = pd.DataFrame({'ds': eval_df[time_col]})
+    start = time.perf_counter()
     forecast = model.predict(future)
+    predict_time = time.perf_counter() - start
     y_true = eval_df[target_col].values
     y_pred = forecast['yhat'].values
 
@@ -75,19 +110,61 @@ def evaluate_model(city_name, model_dir, results):
     print(f"{city_name}: MAE = {mae:.2f}, RMSE = {rmse:.2f}")
 
     # results saved in evaluation_resuslts.csv
-    results.append({
+    result = {
         "city": city_name,
         "MAE": round(mae, 2),
         "RMSE": round(rmse, 2)
-    })
-
-def main():
-    model_dir = Path(__file__).resolve().parent / "saved_models"
+    }
+    if baseline is not None:
+        start = time.perf_counter()
+        baseline_pred = baseline.predict(eval_df[time_col])
+        baseline_predict_time = time.perf_counter() - start
+        baseline_mae = mean_absolute_error(y_true, baseline_pred)
+        baseline_rmse = np.sqrt(mean_squared_error(y_true, baseline_pred))
+        print(f"{city_name}: baseline MAE = {baseline_mae:.2f}, RMSE = {baseline_rmse:.2f}")
+        result.update({
+            "fit_s": split_info.get("fit_s"),
+            "predict_s": round(predict_time, 4),
+            "baseline_MAE": round(baseline_mae, 2),
+            "baseline_RMSE": round(baseline_rmse, 2),
+            "baseline_fit_s": round(baseline_fit_s, 6),
+            "baseline_predict_s": round(baseline_predict_time, 6),
+            "best": HourOfDayForecaster.name if baseline_rmse < rmse else "prophet"
+        })
+    if backtest is not None:
+        ds, y = arrays
+        result.update(backtest_city(city_name, model, ds, y, split_point, **backtest))
+    result["runtime_s"] = round(time.perf_counter() - started, 4)
+    results.append(result)
+
+def main(compare_baseline=False, backtest=False, horizons=BACKTEST_HORIZONS, step_hours=BACKTEST_STEP_HOURS):
+    '''
+    This function evaluates the saved models of all capitals.
+    compare_baseline: also evaluates the hour-of-day baseline and compares fit/predict time and errors with Prophet.
+    backtest: also runs the rolling-origin evaluation with cutoffs every step_hours over the evaluation data,
+    the models are refitted at every cutoff.
+    '''
+    registry = get_registry()
     capitals = get_capitals()
     results = []
+    # loading the data of all capitals with one query
+    city_data = load_all_city_data(days=30)
+    baselines, baseline_fit_s = {}, None
+    if compare_baseline:
+        split_points = load_split_points(registry.store, [city_entry["city"] for city_entry in capitals])
+        baselines, baseline_fit_s = fit_baselines(city_data, split_points)
+        print(f"Baseline fitted for {len(baselines)} capitals ({baseline_fit_s * 1000:.3f}ms per capital).")
+    backtest_options = None
+    if backtest:
+        backtest_options = {"cache": PredictionCache(), "horizons": horizons, "step_hours": step_hours}
     for city_entry in capitals:
         city_name = city_entry["city"]
-        evaluate_model(city_name, model_dir, results)
+        try:
+            evaluate_model(city_name, registry, results, city_data.get(city_name),
+                           baseline=baselines.get(city_name), baseline_fit_s=baseline_fit_s,
+                           backtest=backtest_options)
+        except Exception as e:
+            print(f"Evaluation for {city_name} failed: {e}")
 
     # writing results in the csv file
     results_df = pd.DataFrame(results)
@@ -96,4 +173,15 @@ def main():
     print(f"\nResults saved in: {csv_path}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Evaluate the saved models of all capitals.")
+    parser.add_argument("--compare-baseline", action="store_true",
+                        help="compare Prophet with the hour-of-day baseline")
+    parser.add_argument("--backtest", action="store_true",
+                        help="add the rolling-origin errors per horizon")
+    parser.add_argument("--horizons", type=lambda value: [int(h) for h in value.split(",")],
+                        default=BACKTEST_HORIZONS, help="forecast horizons in hours, e.g. 1,6,24")
+    parser.add_argument("--step", type=int, default=BACKTEST_STEP_HOURS,
+                        help="hours between two cutoffs")
+    args = parser.parse_args()
+    main(compare_baseline=args.compare_baseline, backtest=args.backtest,
+         horizons=args.horizons, step_hours=args.step)
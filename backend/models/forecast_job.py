@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+
+from backend.capitals_data import get_capitals
+from backend.data.new_database import get_db
+from backend.data.cache import invalidate_cache
+from backend.models.registry import get_registry
+from backend.models.model import forecast
+
+# the Plots page offers every full hour from tomorrow until 7 days ahead
+FORECAST_DAYS = 8
+
+def forecast_hours(now=None, days=FORECAST_DAYS):
+    '''
+    This function returns every full hour from the current hour until days ahead.
+    The Plots page looks the forecasts up by their UTC hour.
+    '''
+    now = now or datetime.utcnow()
+    start = now.replace(minute=0, second=0, microsecond=0)
+    return pd.date_range(start, start + timedelta(days=days), freq="h")
+
+def forecast_city(city_name, hours):
+    '''
+    This function predicts all hours for one capital with its saved model.
+    Returns the rows for the forecasts table.
+    '''
+    predictions = forecast(get_registry().get(city_name), hours)
+    return [
+        (city_name, row.ds.to_pydatetime(), float(row.yhat), float(row.yhat_lower), float(row.yhat_upper))
+        for row in predictions[["ds", "yhat", "yhat_lower", "yhat_upper"]].itertuples(index=False)
+    ]
+
+def main():
+    '''
+    This function precomputes hourly forecasts for all capitals and saves them in the forecasts table.
+    Forecasts for hours which are over are removed.
+    '''
+    start = time.perf_counter()
+    hours = forecast_hours()
+    db = get_db()
+    saved, missing = 0, []
+    for city_entry in get_capitals():
+        city_name = city_entry["city"]
+        try:
+            saved += db.upsert_forecasts(forecast_city(city_name, hours))
+        except FileNotFoundError:
+            missing.append(city_name)
+        except Exception as e:
+            print(f"Forecast for {city_name} failed: {e}")
+    removed = db.delete_forecasts_before(hours[0].to_pydatetime())
+    # the cached queries are dropped once for the whole batch
+    invalidate_cache()
+    print(f"{saved} hourly forecasts saved in {time.perf_counter() - start:.1f}s, "
+          f"{removed} outdated removed, {len(missing)} capitals without model.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import Future
+import pandas as pd
+from dotenv import load_dotenv
+
+from backend.data.cache import TTLCache
+from backend.data.new_database import get_db
+from backend.models.model import load_city_data_from_postgres, fit_model, forecast
+from backend.models.registry import get_registry
+
+load_dotenv()
+
+# a saved model which was trained earlier than this is refitted on the latest data before it is used
+MODEL_MAX_AGE_HOURS = float(os.getenv("MODEL_MAX_AGE_HOURS", "24"))
+# memoized forecasts per (city, hour) and how long they stay valid in seconds
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "4096"))
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "3600"))
+
+
+def forecast_hour(target_timestamp):
+    '''
+    This function returns the full hour of a timestamp without time zone, the key of the memoized forecasts.
+    '''
+    target_timestamp = pd.Timestamp(target_timestamp)
+    if target_timestamp.tzinfo is not None:
+        target_timestamp = target_timestamp.tz_localize(None)
+    return target_timestamp.floor("h")
+
+
+def trained_at(entry):
+    '''
+    This function returns the time a saved model was trained, out of its manifest entry.
+    Entries saved before trained_at was recorded fall back to the time the model was saved.
+    '''
+    return datetime.fromisoformat(entry.get("trained_at") or entry["saved_at"])
+
+
+class ForecastService:
+    '''
+    This class returns the forecast of a capital for an hour within milliseconds, if possible:
+    1. memoized forecast of the (city, hour)
+    2. precomputed forecast in the forecasts table
+    3. saved model of the capital, if it was trained less than max_age ago
+    4. model refitted on the last days of data, kept in memory for max_age
+    Identical requests which arrive while a forecast or a refit is computed wait for its result instead of computing it again.
+    Memoized forecasts and refitted models are dropped, when new models are saved in the model store.
+    '''
+    def __init__(self, max_age_hours=MODEL_MAX_AGE_HOURS, days=30):
+        self.max_age = timedelta(hours=max_age_hours)
+        self.days = days
+        self.memo = TTLCache(maxsize=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL)
+        self.refits = 0
+        self.coalesced = 0
+        self._refitted = {}
+        self._in_flight = {}
+        self._revision = None
+        self._lock = threading.Lock()
+
+    def get_forecast(self, city, target_timestamp, days=None):
+        '''
+        This function returns (ds, yhat) of a capital for the hour of target_timestamp.
+        days: days of data for a refit (default: days of the service).
+        '''
+        hour = forecast_hour(target_timestamp)
+        self.check_models()
+        found, value = self.memo.get((city, hour))
+        if found:
+            return value
+        generation = self.memo.generation
+        value = self._coalesce(("forecast", city, hour), lambda: self._compute(city, hour, days))
+        self.memo.set((city, hour), value, generation=generation)
+        return value
+
+    def _compute(self, city, hour, days=None):
+        precomputed = get_db().get_forecast(city, hour.to_pydatetime())
+        if precomputed is not None:
+            return pd.Timestamp(precomputed["ds"]), float(precomputed["yhat"])
+        pred = forecast(self.model(city, days), [hour]).iloc[0]
+        return pd.Timestamp(pred['ds']), float(pred['yhat'])
+
+    def model(self, city, days=None):
+        '''
+        This function returns a fresh model of a capital: the saved one or a refitted one.
+        '''
+        try:
+            model, entry = get_registry().get_with_entry(city)
+            if datetime.now() - trained_at(entry) <= self.max_age:
+                return model
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            refitted = self._refitted.get(city)
+        if refitted is not None and datetime.now() - refitted[0] <= self.max_age:
+            return refitted[1]
+        return self._coalesce(("refit", city), lambda: self._refit(city, days or self.days))
+
+    def _refit(self, city, days):
+        start = time.perf_counter()
+        model = fit_model(load_city_data_from_postgres(city, days=days))
+        with self._lock:
+            self._refitted[city] = (datetime.now(), model)
+            self.refits += 1
+        print(f"Model of {city} was stale and refitted in {time.perf_counter() - start:.1f}s")
+        return model
+
+    def _coalesce(self, key, compute):
+        '''
+        This function runs compute once per key at a time, concurrent callers with the same key share its result.
+        '''
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            future.set_result(compute())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+    def check_models(self):
+        '''
+        This function drops the memoized forecasts and refitted models, if models were saved since the last check,
+        e.g. by the nightly retraining.
+        '''
+        revision = get_registry().store.revision()
+        with self._lock:
+            changed = self._revision is not None and revision != self._revision
+            self._revision = revision
+        if changed:
+            print("New models were saved, memoized forecasts are dropped.")
+            self.clear()
+
+    def clear(self):
+        '''
+        This function drops the memoized forecasts and refitted models, e.g. after new models were trained.
+        '''
+        self.memo.clear()
+        with self._lock:
+            self._refitted.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "refits": self.refits,
+                "coalesced": self.coalesced,
+                "refitted_models": len(self._refitted),
+                "memo": self.memo.stats()
+            }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_forecast_service():
+    '''
+    This function returns the process-wide forecast service.
+    '''
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ForecastService()
+        return _service
@@ -0,0 +1,137 @@
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+
+
+class Forecaster(ABC):
+    '''
+    Interface of all forecasters.
+    fit() trains on a DataFrame with ds and y, predict() returns yhat for an array of timestamps.
+    A forecaster without both methods can not be instantiated.
+    '''
+    name = "base"
+
+    @abstractmethod
+    def fit(self, df: pd.DataFrame):
+        '''
+        This function trains the forecaster and returns it.
+        '''
+
+    @abstractmethod
+    def predict(self, ds) -> np.ndarray:
+        '''
+        This function returns yhat for every timestamp of ds.
+        '''
+
+
+class ProphetForecaster(Forecaster):
+    '''
+    Forecaster with a Prophet model. Prophet is only imported when it is used.
+    '''
+    name = "prophet"
+
+    def __init__(self, model=None, **params):
+        self.params = {"daily_seasonality": True, **params}
+        self.model = model
+
+    def fit(self, df: pd.DataFrame, init: dict = None):
+        from prophet import Prophet
+        self.model = Prophet(**self.params)
+        if init is not None:
+            self.model.fit(df, init=init)
+        else:
+            self.model.fit(df)
+        return self
+
+    def predict(self, ds) -> np.ndarray:
+        forecast = self.model.predict(pd.DataFrame({"ds": pd.to_datetime(ds)}))
+        return forecast["yhat"].to_numpy()
+
+
+class HourOfDayForecaster(Forecaster):
+    '''
+    Fast NumPy baseline: every hour of the day has a level, which is updated day by day
+    with exponential smoothing. The forecast of a timestamp is the level of its hour.
+    '''
+    name = "hour_of_day"
+
+    def __init__(self, alpha: float = 0.3, profile: np.ndarray = None):
+        self.alpha = alpha
+        self.profile = profile
+
+    def fit(self, df: pd.DataFrame):
+        ds = pd.to_datetime(df["ds"]).to_numpy(dtype="datetime64[ns]")
+        y = df["y"].to_numpy(dtype=np.float64)
+        self.profile = fit_hour_profiles([(ds, y)], alpha=self.alpha)[0]
+        return self
+
+    def predict(self, ds) -> np.ndarray:
+        hours = pd.DatetimeIndex(pd.to_datetime(ds)).hour.to_numpy()
+        return self.profile[hours]
+
+    @classmethod
+    def fit_batch(cls, city_data: dict, alpha: float = 0.3):
+        '''
+        This function fits the baseline of all capitals in one vectorized pass.
+        city_data: {city: (ds, y)} as returned by load_all_city_data.
+        Returns {city: HourOfDayForecaster}.
+        '''
+        cities = [city for city, (ds, _) in city_data.items() if len(ds)]
+        profiles = fit_hour_profiles([city_data[city] for city in cities], alpha=alpha)
+        return {city: cls(alpha=alpha, profile=profile) for city, profile in zip(cities, profiles)}
+
+
+def fit_hour_profiles(series: list, alpha: float = 0.3) -> np.ndarray:
+    '''
+    This function computes the smoothed hour-of-day levels of many series at once.
+    series: list of (ds, y) arrays. Returns an array of shape (len(series), 24).
+    Hours without any data get the mean of their series.
+    '''
+    n = len(series)
+    if n == 0:
+        return np.zeros((0, 24))
+    lengths = np.array([len(ds) for ds, _ in series])
+    ds = np.concatenate([np.asarray(ds, dtype="datetime64[ns]") for ds, _ in series])
+    y = np.concatenate([np.asarray(y, dtype=np.float64) for _, y in series])
+    series_idx = np.repeat(np.arange(n), lengths)
+
+    days = ds.astype("datetime64[D]")
+    hours = (ds - days).astype("timedelta64[h]").astype(np.int64)
+    day_idx = (days - days.min()).astype(np.int64)
+    n_days = int(day_idx.max()) + 1
+
+    # mean of every (series, day, hour) cell
+    cell = (series_idx * n_days + day_idx) * 24 + hours
+    sums = np.bincount(cell, weights=y, minlength=n * n_days * 24).reshape(n, n_days, 24)
+    counts = np.bincount(cell, minlength=n * n_days * 24).reshape(n, n_days, 24)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = sums / counts
+
+    # exponential smoothing over the days, all series and hours at once
+    level = np.full((n, 24), np.nan)
+    for day in range(n_days):
+        observed = counts[:, day, :] > 0
+        first = observed & np.isnan(level)
+        update = observed & ~first
+        level[first] = daily[:, day, :][first]
+        level[update] = alpha * daily[:, day, :][update] + (1 - alpha) * level[update]
+
+    series_mean = np.bincount(series_idx, weights=y, minlength=n) / np.maximum(lengths, 1)
+    missing = np.isnan(level)
+    level[missing] = np.broadcast_to(series_mean[:, None], level.shape)[missing]
+    return level
+
+
+# available forecasters by name
+FORECASTERS = {
+    ProphetForecaster.name: ProphetForecaster,
+    HourOfDayForecaster.name: HourOfDayForecaster,
+}
+
+def get_forecaster(name: str, **params) -> Forecaster:
+    '''
+    This function creates a forecaster by its name.
+    '''
+    if name not in FORECASTERS:
+        raise ValueError(f"Unknown forecaster {name}, available: {list(FORECASTERS)}")
+    return FORECASTERS[name](**params)
@@ -1,26 +1,57 @@
+import hashlib
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from prophet import Prophet
-from backend.data.new_database import PostgresDB
+from backend.data.new_database import get_db
+from backend.models.forecasters import ProphetForecaster, get_forecaster
 
-def load_city_data_from_postgres(city_name: str, days: int = 30):
+def load_city_data_from_postgres(city_name: str, days: int = 30, resolution: str = "raw"):
     '''
     This function loads aqi values of a specific capital out of the database. 
+    Longer windows or coarser resolutions are read from the hourly or daily aggregates.
     '''
-    db = PostgresDB()
-    query = """
-        SELECT timestamp, aqi FROM aqi_data
-        WHERE city = %s
-        AND timestamp >= NOW() - INTERVAL '%s days'
-        ORDER BY timestamp ASC
-    """
-    # sql call 
-    df = pd.read_sql_query(query, db.conn, params=(city_name, days))
+    rows = get_db().get_history(city_name, days, resolution=resolution)
+    df = pd.DataFrame(rows, columns=["timestamp", "aqi"])
 
     df['ds'] = pd.to_datetime(df['timestamp'])
     df['y'] = pd.to_numeric(df['aqi'], errors='coerce')
     df = df[['ds', 'y']].dropna()
     return df
 
+def load_all_city_data(days: int = 30, resolution: str = "raw"):
+    '''
+    This function loads the aqi values of all capitals with one streamed query.
+    Returns {city: (ds, y)} with ds as datetime64[ns] and y as float32 NumPy arrays in ascending time order.
+    '''
+    parts = {}
+    chunks = get_db().iter_history(
+        since=datetime.now() - timedelta(days=days),
+        columns=("city", "timestamp", "aqi"),
+        resolution=resolution
+    )
+    for chunk in chunks:
+        df = pd.DataFrame(chunk, columns=["city", "ds", "y"])
+        df["y"] = pd.to_numeric(df["y"], errors="coerce")
+        df = df.dropna()
+        for city, group in df.groupby("city", sort=False):
+            parts.setdefault(city, []).append((
+                pd.to_datetime(group["ds"]).to_numpy(dtype="datetime64[ns]"),
+                group["y"].to_numpy(dtype=np.float32)
+            ))
+    return {
+        city: (np.concatenate([ds for ds, _ in arrays]), np.concatenate([y for _, y in arrays]))
+        for city, arrays in parts.items()
+    }
+
+def city_frame(arrays):
+    '''
+    This function converts the (ds, y) arrays of a capital into a DataFrame for Prophet.
+    '''
+    if arrays is None:
+        return pd.DataFrame({"ds": pd.Series(dtype="datetime64[ns]"), "y": pd.Series(dtype=np.float64)})
+    ds, y = arrays
+    return pd.DataFrame({"ds": ds, "y": y.astype(np.float64)})
+
 def split_train_eval(df: pd.DataFrame, eval_ratio: float = 0.2):
     '''
     This function splits data into training and test set.
@@ -31,29 +62,76 @@ def split_train_eval(df: pd.DataFrame, eval_ratio: float = 0.2):
     eval_df = df.iloc[n:]
     return train_df, eval_df
 
-def train_and_forecast(df: pd.DataFrame, hours_ahead: int = 48):
+def data_fingerprint(df: pd.DataFrame):
+    '''
+    This function returns a hash of the ds and y values, which changes whenever the data changes.
+    '''
+    digest = hashlib.sha1()
+    digest.update(pd.to_datetime(df['ds']).to_numpy(dtype="datetime64[ns]").tobytes())
+    digest.update(df['y'].to_numpy(dtype=np.float64).tobytes())
+    return f"{len(df)}-{digest.hexdigest()}"
+
+def warm_start_params(model):
+    '''
+    This function returns the fitted parameters of a model as initial values for the next fit.
+    '''
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        if model.mcmc_samples == 0:
+            params[name] = model.params[name][0][0]
+        else:
+            params[name] = np.mean(model.params[name])
+    for name in ['delta', 'beta']:
+        if model.mcmc_samples == 0:
+            params[name] = model.params[name][0]
+        else:
+            params[name] = np.mean(model.params[name], axis=0)
+    return params
+
+def fit_model(df: pd.DataFrame, init: dict = None, forecaster: str = "prophet"):
     '''
-    This function train a prophet model and creates predictions for a specific hour.
+    This function trains a model on a DataFrame with ds and y, without predicting anything.
+    init: fitted parameters of a previous model (warm_start_params) to warm-start the optimizer,
+    parameters with a different shape are replaced by Prophet's defaults.
+    forecaster: name of the forecaster (see backend.models.forecasters), "prophet" returns the Prophet model,
+    other forecasters return themselves.
     '''
     if df.empty or len(df) < 10:
         raise ValueError("Not enough data for prediction.")
-    model = Prophet(daily_seasonality=True)
-    model.fit(df)
-    future = model.make_future_dataframe(periods=hours_ahead, freq='H')
-    forecast = model.predict(future)
-    return forecast, model
+    if forecaster == ProphetForecaster.name:
+        return ProphetForecaster().fit(df, init=init).model
+    return get_forecaster(forecaster).fit(df)
+
+def forecast(model, timestamps):
+    '''
+    This function predicts only the requested timestamps with a fitted model.
+    Returns a DataFrame with ds and yhat (and yhat_lower/yhat_upper for Prophet models).
+    '''
+    ds = pd.Series(pd.to_datetime(timestamps)).reset_index(drop=True)
+    if hasattr(model, "make_future_dataframe"):
+        return model.predict(pd.DataFrame({'ds': ds}))
+    return pd.DataFrame({'ds': ds, 'yhat': model.predict(ds)})
+
+def horizon_timestamps(last_ds, hours_ahead: int):
+    '''
+    This function returns the hourly timestamps of the next hours_ahead hours after last_ds.
+    '''
+    return pd.date_range(pd.Timestamp(last_ds), periods=hours_ahead + 1, freq='h')[1:]
+
+def train_and_forecast(df: pd.DataFrame, hours_ahead: int = 48, init: dict = None, forecaster: str = "prophet"):
+    '''
+    This function train a model and predicts the next hours_ahead hours after the training data.
+    Only the horizon is predicted, not the training history.
+    See fit_model for init and forecaster.
+    '''
+    model = fit_model(df, init=init, forecaster=forecaster)
+    return forecast(model, horizon_timestamps(pd.to_datetime(df['ds']).max(), hours_ahead)), model
 
 def predict_aqi_for_city_and_time(city: str, days: int, target_timestamp: pd.Timestamp):
     """
     Gibt die vorhergesagte AQI für eine Stadt zu einem bestimmten Zeitpunkt zurück.
     Returns the predicted aqi for a capital with a specific time.
+    The forecast service reuses the saved model and refits on the last days only if it is stale.
     """
-    df = load_city_data_from_postgres(city, days=days)
-    train_df, _ = split_train_eval(df)
-    hours_ahead = int((target_timestamp - train_df['ds'].max()).total_seconds() // 3600)
-    if hours_ahead <= 0:
-        raise ValueError("Prediction is to close to current time or to close to training data.")
-    forecast, _ = train_and_forecast(train_df, hours_ahead=hours_ahead)
-    
-    pred = forecast.iloc[-1]
-    return pred['ds'], pred['yhat']
+    from backend.models.forecast_service import get_forecast_service
+    return get_forecast_service().get_forecast(city, target_timestamp, days=days)
@@ -0,0 +1,258 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import copy
+import json
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows, the manifest is then only locked within the process
+    fcntl = None
+
+MODEL_DIR = Path(__file__).resolve().parent / "saved_models"
+MANIFEST_NAME = "manifest.json"
+
+# version of the layout of the manifest and the model files,
+# format 1 kept only one history row, which gives NaN intervals for one-hour forecasts
+STORE_FORMAT = 2
+
+
+def compact_model(model):
+    '''
+    This function returns a copy of a fitted Prophet model with only what predict needs.
+    The training history and its dates are reduced to their last two rows (Prophet takes the step of one-row forecasts
+    from the history) and the warm-start values are dropped.
+    '''
+    compact = copy.copy(model)
+    compact.history = model.history.tail(2).copy()
+    # the dates of the kept rows, as Prophet derives them from the history
+    compact.history_dates = pd.to_datetime(pd.Series(compact.history["ds"].unique(), name="ds")).sort_values().reset_index(drop=True)
+    compact.fit_kwargs = {}
+    return compact
+
+
+class ModelStore:
+    '''
+    This class stores the fitted models of all capitals as Prophet JSON files (<city>.json) in one directory.
+    The manifest.json indexes them: per capital the file, its version, hash and size and the split info of the training.
+    Every save increases the version of the capital. Loading does not use pickle.
+    '''
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = Path(model_dir)
+        self.manifest_path = self.model_dir / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+
+    def model_path(self, city):
+        return self.model_dir / f"{city}.json"
+
+    def manifest(self):
+        '''
+        This function returns the manifest, it is read again only if the file changed.
+        '''
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return {"format": STORE_FORMAT, "models": {}}
+        with self._lock:
+            if self._manifest is None or self._manifest_mtime != mtime:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+                if manifest.get("format") != STORE_FORMAT:
+                    raise ValueError(f"Model store format {manifest.get('format')} is not supported, expected {STORE_FORMAT}. "
+                                     "Run python -m backend.models.model_store migrate.")
+                self._manifest, self._manifest_mtime = manifest, mtime
+            return self._manifest
+
+    def revision(self):
+        '''
+        This function returns a value which changes whenever a model was saved (the mtime of the manifest), or None.
+        '''
+        self.manifest()
+        return self._manifest_mtime
+
+    def entry(self, city):
+        '''
+        This function returns the manifest entry of a capital or None.
+        '''
+        return self.manifest()["models"].get(city)
+
+    def cities(self):
+        return sorted(self.manifest()["models"])
+
+    def load(self, city):
+        '''
+        This function loads the model of a capital.
+        Returns the model and its manifest entry. Raises FileNotFoundError, if no model was saved for it.
+        '''
+        from prophet.serialize import model_from_json
+        entry = self.entry(city)
+        if entry is None:
+            raise FileNotFoundError(f"No model for {city} exists. Please train a model first.")
+        with open(self.model_dir / entry["file"]) as f:
+            return model_from_json(f.read()), entry
+
+    def save(self, city, model, info=None):
+        '''
+        This function saves the compact model of a capital and registers it in the manifest with the next version.
+        info: split info of the training, saved with the entry.
+        Returns the new manifest entry.
+        '''
+        from prophet.serialize import model_to_json
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        data = model_to_json(compact_model(model)).encode()
+        path = self.model_path(city)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        with self._manifest_lock():
+            manifest = self._read_manifest_file()
+            previous = manifest["models"].get(city, {})
+            os.replace(tmp_path, path)
+            entry = {
+                **(info or {}),
+                "file": path.name,
+                "version": previous.get("version", 0) + 1,
+                "sha1": hashlib.sha1(data).hexdigest(),
+                "bytes": len(data),
+                "saved_at": datetime.now().isoformat(timespec="seconds")
+            }
+            manifest["models"][city] = entry
+            self._write_manifest_file(manifest)
+        return entry
+
+    def _read_manifest_file(self):
+        if not self.manifest_path.exists():
+            return {"format": STORE_FORMAT, "models": {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest_file(self, manifest):
+        tmp_path = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def _manifest_lock(self):
+        '''
+        The training processes save their models in parallel, the manifest is updated under a file lock.
+        '''
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.model_dir / f"{MANIFEST_NAME}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    '''
+    This function returns the process-wide model store.
+    '''
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ModelStore()
+        return _store
+
+
+# keys of a manifest entry which are written by save, the others are the split info of the training
+ENTRY_KEYS = ("file", "version", "sha1", "bytes", "saved_at")
+
+def upgrade(model_dir=MODEL_DIR):
+    '''
+    This function rewrites the models of an older store format in the current format.
+    Models of format 1 with only one history row can not be repaired, they are removed and must be retrained.
+    '''
+    from prophet.serialize import model_from_json
+    store = ModelStore(model_dir)
+    manifest = store._read_manifest_file()
+    old_format = manifest.get("format")
+    if old_format == STORE_FORMAT:
+        return
+    if old_format != 1:
+        raise ValueError(f"Model store format {old_format} can not be upgraded.")
+    rewritten, removed = 0, []
+    for city, entry in sorted(manifest["models"].items()):
+        path = store.model_dir / entry["file"]
+        with open(path) as f:
+            model = model_from_json(f.read())
+        if len(model.history) < 2:
+            removed.append(city)
+            path.unlink()
+            continue
+        store.save(city, model, {key: value for key, value in entry.items() if key not in ENTRY_KEYS})
+        rewritten += 1
+    with store._manifest_lock():
+        manifest = store._read_manifest_file()
+        for city in removed:
+            manifest["models"].pop(city, None)
+        manifest["format"] = STORE_FORMAT
+        store._write_manifest_file(manifest)
+    print(f"Model store upgraded from format {old_format} to {STORE_FORMAT}: {rewritten} models rewritten, "
+          f"{len(removed)} removed, which must be retrained{': ' + ', '.join(removed) if removed else '.'}")
+
+def migrate(model_dir=MODEL_DIR, keep=False):
+    '''
+    This function upgrades a store of an older format and converts the pickled models (<city>_prophet.pkl)
+    and their split files (<city>_split.json) into the model store.
+    Only run it on model files you created yourself, it unpickles them once.
+    keep: keeps the old files, otherwise they are removed after the conversion.
+    '''
+    import joblib
+    upgrade(model_dir)
+    model_dir = Path(model_dir)
+    store = ModelStore(model_dir)
+    converted, old_bytes, new_bytes = 0, 0, 0
+    for pkl_path in sorted(model_dir.glob("*_prophet.pkl")):
+        city = pkl_path.name[:-len("_prophet.pkl")]
+        split_path = model_dir / f"{city}_split.json"
+        info = {}
+        if split_path.exists():
+            with open(split_path) as f:
+                info = json.load(f)
+        try:
+            entry = store.save(city, joblib.load(pkl_path), info)
+        except Exception as e:
+            print(f"Model of {city} could not be converted: {e}")
+            continue
+        converted += 1
+        old_bytes += pkl_path.stat().st_size + (split_path.stat().st_size if split_path.exists() else 0)
+        new_bytes += entry["bytes"]
+        if not keep:
+            pkl_path.unlink()
+            if split_path.exists():
+                split_path.unlink()
+    print(f"{converted} models converted, {old_bytes / 1e6:.1f} MB -> {new_bytes / 1e6:.1f} MB.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manages the store of the trained models.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="upgrade the store and convert pickled models into it")
+    migrate_parser.add_argument("--keep", action="store_true", help="keep the pickled models")
+    subparsers.add_parser("list", help="list the stored models")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(keep=args.keep)
+    else:
+        store = get_store()
+        for city in store.cities():
+            entry = store.entry(city)
+            print(f"{city}: version {entry['version']}, {entry['bytes']} bytes, saved at {entry['saved_at']}")
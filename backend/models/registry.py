@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+import tracemalloc
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from backend.models.model_store import MODEL_DIR, ModelStore
+
+load_dotenv()
+
+# maximum number of deserialized models which are kept in memory
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "16"))
+
+
+_measure_lock = threading.Lock()
+_prophet_loaded = False
+
+def measure_memory(load):
+    '''
+    This function calls load and returns its result and the bytes it allocated which are still in use afterwards.
+    tracemalloc counts the allocations of all threads, so the measured loads run one at a time.
+    '''
+    global _prophet_loaded
+    with _measure_lock:
+        # Prophet and its Stan backend are imported lazily by the first model, the imports are not part of its footprint
+        if not _prophet_loaded:
+            from prophet import Prophet
+            Prophet()
+            _prophet_loaded = True
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            result = load()
+            size = max(tracemalloc.get_traced_memory()[0] - before, 0)
+        finally:
+            if started:
+                tracemalloc.stop()
+    return result, size
+
+
+class ModelRegistry:
+    '''
+    This class loads the models of the model store lazily and keeps the most recently used ones in memory.
+    A model is loaded again, if a new version of it was saved since it was loaded.
+    It records the load time, the serialized size and the memory footprint of every model.
+    The footprint is the memory allocated by the deserialization and still in use afterwards, measured with tracemalloc.
+    '''
+    def __init__(self, model_dir=MODEL_DIR, maxsize=MODEL_CACHE_SIZE):
+        self.store = ModelStore(model_dir)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._models = OrderedDict()
+        self._load_stats = {}
+        self._lock = threading.Lock()
+        self._city_locks = {}
+
+    def get(self, city):
+        '''
+        This function returns the model of a capital.
+        Raises FileNotFoundError, if no model was trained for it.
+        '''
+        return self.get_with_entry(city)[0]
+
+    def get_with_entry(self, city):
+        '''
+        This function returns the model of a capital and its manifest entry, loading the model only if necessary.
+        '''
+        entry = self.store.entry(city)
+        if entry is None:
+            raise FileNotFoundError(f"No model for {city} exists. Please train a model first.")
+        version = entry["version"]
+        with self._lock:
+            cached = self._models.get(city)
+            if cached is not None and cached[0] == version:
+                self._models.move_to_end(city)
+                self.hits += 1
+                return cached[1], cached[2]
+            city_lock = self._city_locks.setdefault(city, threading.Lock())
+
+        # only one thread loads the same model, the others wait for its result
+        with city_lock:
+            with self._lock:
+                cached = self._models.get(city)
+                if cached is not None and cached[0] == version:
+                    self._models.move_to_end(city)
+                    self.hits += 1
+                    return cached[1], cached[2]
+                self.misses += 1
+
+            start = time.perf_counter()
+            (model, entry), size = measure_memory(lambda: self.store.load(city))
+            load_time = time.perf_counter() - start
+
+            with self._lock:
+                self._models[city] = (entry["version"], model, entry)
+                self._models.move_to_end(city)
+                while len(self._models) > self.maxsize:
+                    self._models.popitem(last=False)
+                    self.evictions += 1
+                previous = self._load_stats.get(city, {})
+                self._load_stats[city] = {
+                    "model": city,
+                    "version": entry["version"],
+                    "load_time": round(load_time, 4),
+                    "serialized_bytes": entry.get("bytes", 0),
+                    "memory_bytes": size,
+                    "loads": previous.get("loads", 0) + 1
+                }
+            print(f"Model of {city} (version {entry['version']}) loaded in {load_time:.2f}s "
+                  f"({size / 1e3:.0f} KB in memory, {entry.get('bytes', 0) / 1e3:.0f} KB serialized)")
+            return model, entry
+
+    def stats(self):
+        '''
+        This function returns the counters of the registry and the load statistics per model.
+        '''
+        with self._lock:
+            return {
+                "cached": len(self._models),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_bytes": sum(self._load_stats[key]["memory_bytes"] for key in self._models),
+                "models": [dict(stats, cached=key in self._models) for key, stats in self._load_stats.items()]
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    '''
+    This function returns the process-wide model registry.
+    '''
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -1,13 +1,17 @@
 import sys
 import os
-import json
+import time
+import argparse
 from pathlib import Path
-import joblib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from backend.models.model import load_city_data_from_postgres, train_and_forecast
+from backend.models.model import load_all_city_data, city_frame, fit_model, data_fingerprint, warm_start_params
+from backend.models.forecast_job import main as run_forecast_job
+from backend.models.model_store import MODEL_DIR, ModelStore
 from backend.capitals_data import get_capitals
 
 def find_time_column(df):
@@ -19,47 +23,152 @@ def find_time_column(df):
             return col
     raise ValueError(f"No timestamp column is found! Existing columns: {df.columns}")
 
-def main():
+# number of parallel training processes (default: one per CPU core)
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", "0")) or os.cpu_count() or 1
+
+def train_city(city_name, model_dir, incremental=False, arrays=None):
+    '''
+    This function trains and saves the model of one capital.
+    arrays: (ds, y) arrays of the capital out of load_all_city_data.
+    In incremental mode capitals whose data did not change since the last fit are skipped,
+    the others are warm-started from the fitted parameters of their previous model.
+    Returns the report of the city with status and timings.
+    '''
+    report = {"city": city_name, "status": "trained", "rows": 0, "warm_start": False,
+              "load_s": 0.0, "fit_s": 0.0, "saved_s": None, "save_s": 0.0, "error": ""}
+    start = time.perf_counter()
+    print(f"Train model for {city_name} ...")
+    df = city_frame(arrays)
+    report["rows"] = len(df)
+    report["load_s"] = round(time.perf_counter() - start, 3)
+    if len(df) < 10:
+        print(f"Not enough data for {city_name}, skip.")
+        report["status"] = "skipped"
+        return report
+
+    time_col = find_time_column(df)
+    df[time_col] = pd.to_datetime(df[time_col])
+    df = df.sort_values(time_col)
+
+    store = ModelStore(model_dir)
+    previous = store.entry(city_name) or {}
+    fingerprint = data_fingerprint(df)
+    if incremental and previous and previous.get("fingerprint") == fingerprint:
+        print(f"Data of {city_name} did not change since the last fit, skip.")
+        report["status"] = "unchanged"
+        return report
+
+    # 80/20 Split
+    n = len(df)
+    split_idx = int(n * 0.8)
+    train_df = df.iloc[:split_idx]
+    test_df = df.iloc[split_idx:]
+    split_point = df[time_col].iloc[split_idx]  # timestamp of the split point
+
+    if len(train_df) < 10:
+        print(f"Not enough trainings data for {city_name}, skip.")
+        report["status"] = "skipped"
+        return report
+
+    init = None
+    if incremental and previous:
+        try:
+            init = warm_start_params(store.load(city_name)[0])
+        except Exception as e:
+            print(f"Previous model of {city_name} can not be used for a warm start: {e}")
+
+    fit_start = time.perf_counter()
+    # the forecasts are predicted afterwards by the forecast job, only the fit is needed here
+    model = fit_model(train_df, init=init)
+    fit_time = time.perf_counter() - fit_start
+    report["fit_s"] = round(fit_time, 3)
+    report["warm_start"] = init is not None
+
+    # the duration of the last cold fit is the reference for the time saved by warm starts
+    cold_fit_s = previous.get("cold_fit_s") if init is not None else fit_time
+    if init is not None and cold_fit_s is not None:
+        report["saved_s"] = round(cold_fit_s - fit_time, 3)
+        print(f"Warm start for {city_name} took {fit_time:.2f}s, {report['saved_s']:.2f}s faster than the last cold fit.")
+
+    save_start = time.perf_counter()
+    # the split info is saved with the model in the manifest of the store
+    split_info = {
+        "split_point": str(split_point),
+        "time_col": time_col,
+        "fingerprint": fingerprint,
+        "fit_s": round(fit_time, 3),
+        "cold_fit_s": round(cold_fit_s, 3) if cold_fit_s is not None else None,
+        "warm_start": init is not None,
+        # the model is served as fresh for MODEL_MAX_AGE_HOURS after its training,
+        # its training data ends earlier because of the evaluation split
+        "trained_at": datetime.now().isoformat(timespec="seconds")
+    }
+    entry = store.save(city_name, model, split_info)
+    report["save_s"] = round(time.perf_counter() - save_start, 3)
+    print(f"Model and split point for {city_name} saved as version {entry['version']} under {store.model_dir / entry['file']}")
+    return report
+
+def main(workers=TRAIN_WORKERS, incremental=False):
     '''
     This function is the main function for training and saving model predictions for capitals.
+    The capitals are trained in parallel by a pool of worker processes (workers=1 trains sequentially).
+    incremental: skips unchanged capitals and warm-starts the others from their previous model.
+    A report with timings and failures per capital is saved in training_report.csv.
     '''
-    hours_ahead = 7 * 24  # 7 days for prediction
-    model_dir = Path(__file__).resolve().parent / "saved_models"
+    model_dir = MODEL_DIR
     model_dir.mkdir(parents=True, exist_ok=True)
 
     capitals = get_capitals()
-    for city_entry in capitals:
-        city_name = city_entry["city"]
-        print(f"Train model for {city_name} ...")
-        # Loading all available data
-        df = load_city_data_from_postgres(city_name)
-        if len(df) < 10:
-            print(f"Not enough data for {city_name}, skip.")
-            continue
-
-        time_col = find_time_column(df)
-        df[time_col] = pd.to_datetime(df[time_col])
-        df = df.sort_values(time_col)
-
-        # 80/20 Split
-        n = len(df)
-        split_idx = int(n * 0.8)
-        train_df = df.iloc[:split_idx]
-        test_df = df.iloc[split_idx:]
-        split_point = df[time_col].iloc[split_idx]  # timestamp of the split point
-
-        if len(train_df) < 10:
-            print(f"Not enough trainings data for {city_name}, skip.")
-            continue
-
-        forecast, model = train_and_forecast(train_df, hours_ahead=hours_ahead)
-        model_path = model_dir / f"{city_name}_prophet.pkl"
-        joblib.dump(model, model_path)
-        # save split info
-        split_info = {"split_point": str(split_point), "time_col": time_col}
-        with open(model_dir / f"{city_name}_split.json", "w") as f:
-            json.dump(split_info, f)
-        print(f"Model and split point for {city_name} saved under {model_path}")
+    city_names = [city_entry["city"] for city_entry in capitals]
+    reports = []
+    start = time.perf_counter()
+
+    # Loading all available data of all capitals with one query
+    city_data = load_all_city_data()
+    print(f"Loaded data of {len(city_data)} capitals in {time.perf_counter() - start:.1f}s")
+
+    def failed(city_name, error):
+        print(f"Training for {city_name} failed: {error}")
+        return {"city": city_name, "status": "failed", "error": str(error)}
+
+    if workers <= 1:
+        for city_name in city_names:
+            try:
+                reports.append(train_city(city_name, model_dir, incremental, city_data.get(city_name)))
+            except Exception as e:
+                reports.append(failed(city_name, e))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(train_city, city_name, model_dir, incremental, city_data.get(city_name)): city_name
+                       for city_name in city_names}
+            for future in as_completed(futures):
+                try:
+                    reports.append(future.result())
+                except Exception as e:
+                    reports.append(failed(futures[future], e))
+
+    wall_time = time.perf_counter() - start
+    report_df = pd.DataFrame(reports).sort_values("city")
+    report_path = Path(__file__).resolve().parent / "training_report.csv"
+    report_df.to_csv(report_path, index=False)
+    counts = report_df["status"].value_counts().to_dict()
+    print(f"\nTraining finished in {wall_time:.1f}s with {workers} worker(s): {counts}")
+    if "saved_s" in report_df and report_df["saved_s"].notna().any():
+        print(f"Warm starts saved {report_df['saved_s'].sum():.1f}s compared with cold fits.")
+    print(f"Report saved in: {report_path}")
+
+    # precomputes the hourly forecasts of the Plots page with the new models
+    try:
+        run_forecast_job()
+    except Exception as e:
+        print(f"Forecast job failed: {e}")
+    return report_df
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Trains a Prophet model for every capital.")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS,
+                        help="number of parallel training processes (1 = sequential)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip capitals without new data and warm-start the others")
+    args = parser.parse_args()
+    main(workers=args.workers, incremental=args.incremental)
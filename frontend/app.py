@@ -3,26 +3,22 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import streamlit as st
-import threading
 from frontend.search import show_search              
 from frontend.main_map import show_worldmap
 from frontend.favorites import show_fav_cities
 import folium
 from streamlit_folium import st_folium
 from frontend.plots import show_aqi_plots
-from backend.data.scheduler import start_scheduler
+from frontend.city_index import get_city_index
+from frontend.data_cache import start_sweep_listener
 
 
-# scheduler for update
-def run_scheduler_once():
-    '''
-    This function calls the scheduler.py script, which updates the aqi values every 15 minutes, if the app is running.
-    '''
-    if "scheduler_started" not in st.session_state:
-        threading.Thread(target=start_scheduler, daemon=True).start()
-        st.session_state["scheduler_started"] = True
+# the aqi values are updated every 15 minutes by the ingest worker (python -m backend.ingest), not by the app.
+# The cached data of the views is dropped once per process, when the worker publishes a finished sweep.
+start_sweep_listener()
 
-run_scheduler_once()
+# the autocomplete index of the search is built once per process at startup
+get_city_index()
 
 
 # Set app title and layout
@@ -0,0 +1,125 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import bisect
+import threading
+import unicodedata
+from pathlib import Path
+from collections import Counter, defaultdict
+from backend.capitals_data import get_capitals
+
+# optional list of further WAQI stations: JSON list of names or of objects with "city" and "country"
+STATIONS_PATH = Path(os.getenv("STATIONS_PATH", str(Path(__file__).resolve().parent / "static" / "stations.json")))
+
+# minimal trigram similarity (Dice coefficient) of a fuzzy suggestion
+MIN_SIMILARITY = 0.3
+
+_index = None
+_lock = threading.Lock()
+
+
+def fold(name):
+    '''
+    This function returns the search key of a name: without accents, case-folded, only letters and digits with single spaces.
+    Dots and apostrophes are dropped ("D.C." -> "dc"), other characters separate words.
+    '''
+    decomposed = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in decomposed if not unicodedata.combining(c) and c not in ".'’").casefold()
+    return " ".join("".join(c if c.isalnum() else " " for c in text).split())
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CityIndex:
+    '''
+    This class suggests city names for a typed text, by prefix of any word of the name and,
+    for typos, by shared trigrams. Every city has one canonical name, which is also the key of the AQI cache.
+    '''
+    def __init__(self, entries):
+        self.entries = []
+        self._keys = []
+        self._gram_counts = []
+        self._by_key = {}
+        self._trigrams = defaultdict(list)
+        words = []
+        for entry in entries:
+            key = fold(entry["city"])
+            if not key or key in self._by_key:
+                continue
+            entry_id = len(self.entries)
+            self.entries.append(entry)
+            self._keys.append(key)
+            self._by_key[key] = entry_id
+            # every word start is a prefix, so "city" finds "Mexico City"
+            position = 0
+            for word in key.split(" "):
+                words.append((key[position:], entry_id))
+                position += len(word) + 1
+            grams = trigrams(key)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._trigrams[gram].append(entry_id)
+        words.sort()
+        self._prefix_keys = [word for word, _ in words]
+        self._prefix_ids = [entry_id for _, entry_id in words]
+
+    def resolve(self, query):
+        '''
+        This function returns the canonical name of an exactly matching city or None.
+        '''
+        entry_id = self._by_key.get(fold(query))
+        return None if entry_id is None else self.entries[entry_id]["city"]
+
+    def suggest(self, query, limit=5):
+        '''
+        This function returns up to limit entries for a typed text, prefix matches before fuzzy matches.
+        '''
+        key = fold(query)
+        if not key:
+            return []
+        found = set()
+        start = bisect.bisect_left(self._prefix_keys, key)
+        for i in range(start, len(self._prefix_keys)):
+            if not self._prefix_keys[i].startswith(key):
+                break
+            found.add(self._prefix_ids[i])
+        # names which start with the text first, then shorter names
+        matches = sorted(found, key=lambda i: (not self._keys[i].startswith(key), len(self._keys[i]), i))
+        if len(matches) < limit:
+            grams = trigrams(key)
+            shared = Counter(entry_id for gram in grams for entry_id in self._trigrams.get(gram, ()))
+            scored = []
+            for entry_id, count in shared.items():
+                if entry_id in found:
+                    continue
+                score = 2 * count / (len(grams) + self._gram_counts[entry_id])
+                if score >= MIN_SIMILARITY:
+                    scored.append((-score, entry_id))
+            matches += [entry_id for _, entry_id in sorted(scored)]
+        return [self.entries[i] for i in matches[:limit]]
+
+
+def load_stations(path=STATIONS_PATH):
+    '''
+    This function reads the optional station list. Returns an empty list, if it does not exist.
+    '''
+    if not Path(path).exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        stations = json.load(f)
+    return [{"city": station} if isinstance(station, str) else station for station in stations]
+
+def get_city_index():
+    '''
+    This function returns the city index of the capitals and the bundled stations, built once per process.
+    '''
+    global _index
+    with _lock:
+        if _index is None:
+            capitals = [{"city": c["city"], "country": c["country"], "capital": True} for c in get_capitals()]
+            _index = CityIndex(capitals + load_stations())
+        return _index
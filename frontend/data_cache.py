@@ -0,0 +1,159 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+import pandas as pd
+from dotenv import load_dotenv
+from backend.api import fetch_aqi
+from backend.capitals_data import get_capitals
+from backend.data.cache import TTLCache, QUERY_CACHE_TTL, cached_query, invalidate_cache, query_cache
+from backend.data.new_database import get_db, NotificationListener, SWEEP_DONE_CHANNEL
+from frontend.city_index import get_city_index
+
+load_dotenv()
+
+# searched cities which are no capitals, shared by all sessions for one ingest period
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+# while finished sweeps are notified, cached results expire only after this many seconds (a few ingest periods),
+# in case a notification is lost
+EVENT_CACHE_TTL = float(os.getenv("EVENT_CACHE_TTL", str(4 * QUERY_CACHE_TTL)))
+# seconds after which the listener checks its connection, if no sweep was notified
+LISTEN_POLL_SECONDS = float(os.getenv("LISTEN_POLL_SECONDS", "60"))
+
+# id of the newest sweep published by the ingest worker, the views redraw when it changes
+_latest_sweep = {"id": None}
+_listener = None
+_listener_lock = threading.Lock()
+
+# Cached reads of the Streamlit views. The results are shared by all sessions
+# and stay valid until the ingest worker publishes the next sweep, so reruns do not touch Postgres.
+# The returned objects are shared, callers must not modify them.
+
+@cached_query
+def latest_aqi_per_city():
+    '''
+    Returns the newest AQI reading of every capital.
+    '''
+    return get_db().get_latest_aqi_per_city()
+
+@cached_query
+def latest_aqi_with_continents():
+    '''
+    Returns the newest AQI readings merged with the continent of every country.
+    '''
+    df_aqi = pd.DataFrame(latest_aqi_per_city(), columns=["country", "city", "lat", "lon", "aqi", "timestamp"])
+    df_capitals = pd.DataFrame(get_capitals())[["country", "continent"]]
+    return pd.merge(df_aqi, df_capitals, on="country", how="left")
+
+@cached_query
+def countries():
+    return get_db().get_countries()
+
+@cached_query
+def cities(country):
+    return get_db().get_cities(country)
+
+@cached_query
+def city_history(city, country, days, resolution):
+    '''
+    Returns the AQI history of a capital for the last days as DataFrame with timestamp and aqi.
+    '''
+    chunks = get_db().iter_history(
+        city=city,
+        country=country,
+        since=datetime.now() - timedelta(days=days),
+        columns=("timestamp", "aqi"),
+        resolution=resolution
+    )
+    frames = [pd.DataFrame(chunk, columns=["timestamp", "aqi"]) for chunk in chunks]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["timestamp", "aqi"])
+
+def normalize_city(name):
+    '''
+    Returns the key of a city name: unicode normalized, case-folded and with single spaces.
+    '''
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+def latest_capital_aqi(city):
+    '''
+    Returns the newest AQI reading of a capital in the format of fetch_aqi or None, if it is no capital.
+    '''
+    key = normalize_city(city)
+    for row in latest_aqi_per_city():
+        if normalize_city(row["city"]) == key:
+            return {
+                "city": row["city"],
+                "aqi": row["aqi"],
+                "lat": row["lat"],
+                "lon": row["lon"],
+                "timestamp": row["timestamp"].isoformat()
+            }
+    return None
+
+def lookup_aqi(city):
+    '''
+    Returns the current AQI of a city in the format of fetch_aqi or None.
+    Capitals are answered from the latest ingested reading, other cities are requested
+    from WAQI once per ingest period and shared by all sessions.
+    Known cities are looked up and cached by their canonical name.
+    '''
+    city = get_city_index().resolve(city) or city
+    try:
+        capital = latest_capital_aqi(city)
+    except Exception as e:
+        print(f"Latest AQI of {city} could not be read: {e}")
+        capital = None
+    if capital is not None:
+        return capital
+
+    key = normalize_city(city)
+    found, value = search_cache.get(key)
+    if found:
+        return value
+    generation = search_cache.generation
+    value = fetch_aqi(city)
+    # failed requests are not cached, they are repeated on the next search
+    if value is not None:
+        search_cache.set(key, value, generation=generation)
+    return value
+
+def on_sweep_done(notify):
+    print(f"Sweep {notify.payload} finished, the cached AQI data is dropped.")
+    invalidate_cache()
+    _latest_sweep["id"] = int(notify.payload)
+
+def on_listener_connect():
+    # sweeps may have finished while no connection was open, cached results mostly expire with the next sweep
+    invalidate_cache()
+    query_cache.set_ttl(EVENT_CACHE_TTL)
+
+def on_listener_disconnect():
+    # without notifications the cached results expire after one ingest period again
+    query_cache.set_ttl(QUERY_CACHE_TTL)
+
+def start_sweep_listener():
+    '''
+    Starts the listener for finished sweeps once per process. Every finished sweep drops the cached query results.
+    '''
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = NotificationListener(
+                [SWEEP_DONE_CHANNEL],
+                on_notify=on_sweep_done,
+                on_connect=on_listener_connect,
+                on_disconnect=on_listener_disconnect,
+                poll_seconds=LISTEN_POLL_SECONDS
+            ).start()
+        return _listener
+
+def latest_sweep():
+    '''
+    Returns the id of the newest sweep which was published since the start of the process or None.
+    '''
+    return _latest_sweep["id"]
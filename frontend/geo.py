@@ -0,0 +1,160 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import time
+import threading
+from pathlib import Path
+from backend.http_client import get_client
+
+GEOJSON_URL = "https://raw.githubusercontent.com/johan/world.geo.json/master/countries.geo.json"
+
+# the GeoJSON is cached on disk, so the map also renders offline
+GEOJSON_DIR = Path(__file__).resolve().parent / "static"
+RAW_GEOJSON_PATH = GEOJSON_DIR / "countries.geo.json"
+SIMPLIFIED_GEOJSON_PATH = GEOJSON_DIR / "countries.simplified.geo.json"
+
+# zoom levels of the world map
+MIN_ZOOM = 2
+MAX_ZOOM = 8
+
+# after a failed download the borders are not requested again for this many seconds
+GEOJSON_RETRY_SECONDS = float(os.getenv("GEOJSON_RETRY_SECONDS", "600"))
+
+# half a pixel in degrees at the highest zoom level, finer details are not visible on the map
+SIMPLIFY_TOLERANCE = 360 / (256 * 2 ** MAX_ZOOM) / 2
+
+_countries = None
+# (time.monotonic() of the failed load, error), reraised until GEOJSON_RETRY_SECONDS are over
+_failure = None
+_lock = threading.Lock()
+
+
+def point_line_distance(point, start, end):
+    '''
+    This function returns the distance of a point to the line between start and end.
+    '''
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    if dx == 0 and dy == 0:
+        return ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+    t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+    px, py = x1 + t * dx, y1 + t * dy
+    return ((x - px) ** 2 + (y - py) ** 2) ** 0.5
+
+def simplify_line(points, tolerance):
+    '''
+    This function simplifies a line with the Douglas-Peucker algorithm.
+    The first and the last point are always kept.
+    '''
+    if len(points) < 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            dist = point_line_distance(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+def simplify_ring(ring, tolerance):
+    '''
+    This function simplifies a closed ring of a polygon.
+    Returns None, if the ring collapses.
+    '''
+    simplified = [[round(x, 4), round(y, 4)] for x, y in simplify_line(ring, tolerance)]
+    return simplified if len(simplified) >= 4 else None
+
+def simplify_geometry(geometry, tolerance=SIMPLIFY_TOLERANCE):
+    '''
+    This function simplifies a Polygon or MultiPolygon geometry.
+    Collapsed holes are removed, a collapsed outer ring is kept unchanged.
+    '''
+    def simplify_polygon(polygon):
+        outer = simplify_ring(polygon[0], tolerance) or polygon[0]
+        holes = [ring for ring in (simplify_ring(hole, tolerance) for hole in polygon[1:]) if ring]
+        return [outer] + holes
+
+    if geometry["type"] == "Polygon":
+        return {"type": "Polygon", "coordinates": simplify_polygon(geometry["coordinates"])}
+    if geometry["type"] == "MultiPolygon":
+        return {"type": "MultiPolygon", "coordinates": [simplify_polygon(p) for p in geometry["coordinates"]]}
+    return geometry
+
+def simplify_geojson(geojson, tolerance=SIMPLIFY_TOLERANCE):
+    '''
+    This function returns a copy of a FeatureCollection with simplified geometries.
+    '''
+    features = []
+    for feature in geojson["features"]:
+        features.append({
+            "type": "Feature",
+            "id": feature.get("id"),
+            "properties": {"name": feature["properties"]["name"]},
+            "geometry": simplify_geometry(feature["geometry"], tolerance)
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+def download_geojson():
+    '''
+    This function downloads the country borders and stores them in the disk cache.
+    '''
+    geojson = get_client().get_json(GEOJSON_URL, timeout=30)
+    GEOJSON_DIR.mkdir(parents=True, exist_ok=True)
+    with open(RAW_GEOJSON_PATH, "w", encoding="utf-8") as f:
+        json.dump(geojson, f)
+    return geojson
+
+def load_simplified_geojson():
+    '''
+    This function returns the simplified country borders.
+    Uses the simplified disk cache, otherwise the raw cache, and downloads only if both are missing.
+    '''
+    if SIMPLIFIED_GEOJSON_PATH.exists():
+        with open(SIMPLIFIED_GEOJSON_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    if RAW_GEOJSON_PATH.exists():
+        with open(RAW_GEOJSON_PATH, encoding="utf-8") as f:
+            geojson = json.load(f)
+    else:
+        geojson = download_geojson()
+    simplified = simplify_geojson(geojson)
+    GEOJSON_DIR.mkdir(parents=True, exist_ok=True)
+    with open(SIMPLIFIED_GEOJSON_PATH, "w", encoding="utf-8") as f:
+        json.dump(simplified, f, separators=(",", ":"))
+    return simplified
+
+def get_countries():
+    '''
+    This function returns the simplified GeoJSON and the country name -> feature index.
+    Both are loaded once per process. If loading failed, the error is raised again without a new download
+    until GEOJSON_RETRY_SECONDS are over, so an offline app does not wait for the download on every rerun.
+    '''
+    global _countries, _failure
+    with _lock:
+        if _countries is None:
+            if _failure is not None and time.monotonic() - _failure[0] < GEOJSON_RETRY_SECONDS:
+                raise _failure[1]
+            try:
+                geojson = load_simplified_geojson()
+            except Exception as e:
+                _failure = (time.monotonic(), e)
+                raise
+            index = {feature["properties"]["name"]: feature for feature in geojson["features"]}
+            _countries = (geojson, index)
+            _failure = None
+        return _countries
+
+if __name__ == "__main__":
+    # fills the disk cache, e.g. while building the docker image
+    geojson, index = get_countries()
+    print(f"{len(index)} countries cached in {SIMPLIFIED_GEOJSON_PATH}")
@@ -5,58 +5,22 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-import requests
 import pandas as pd
 import json
-from datetime import datetime, timedelta
-from backend.capitals_data import get_capitals
-from backend.api import get_aqi_for_city
-from backend.data.new_database import PostgresDB
+from backend.data.new_database import get_db
+from frontend.geo import get_countries, MIN_ZOOM, MAX_ZOOM
+from frontend.data_cache import latest_aqi_per_city, latest_aqi_with_continents, latest_sweep
 
 
-UPDATE_INTERVAL_MINUTES = 15
-
-db = PostgresDB()
-
-# button for updating the AQI-values manually
-def safe_int(value):
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return None
-
+# seconds between two checks for a published sweep and of the progress of a requested sweep
+SWEEP_POLL_SECONDS = 2
 
 def update_aqi_data():
-    capitals_list = get_capitals()
-    for entry in capitals_list:
-        country = entry["country"]
-        capital = entry["city"]
-        aqi_data = get_aqi_for_city(capital, country)
-
-        if aqi_data:
-            aqi_value = safe_int(aqi_data.get("aqi"))
-            if aqi_value is not None:
-                db.insert_aqi(
-                    country=country,
-                    city=capital,
-                    lat=aqi_data["lat"],
-                    lon=aqi_data["lon"],
-                    aqi=aqi_value,
-                    timestamp=aqi_data["timestamp"]
-                )
-
-# automatically update of aqi values every 15 minutes
-if "last_update" not in st.session_state:
-    st.session_state["last_update"] = None
-
-now = datetime.utcnow()
-
-# automatic update, if session_state is set and 15 minutes are over
-if st.session_state["last_update"] is not None:
-    if now - st.session_state["last_update"] > timedelta(minutes=15):
-        update_aqi_data()
-        st.session_state["last_update"] = now
-
+    '''
+    Queues a sweep of all capitals for the ingest worker, the app itself never requests the api.
+    Returns the id of the queued or already running sweep, or None if it could not be queued.
+    '''
+    return get_db().request_sweep("button")
 
 def get_aqi_color(aqi):
     '''
@@ -82,6 +46,31 @@ def get_aqi_color(aqi):
     else:
         return "#f44336" # red=bad
 
+# styles of all countries for the last AQI snapshot, so they are only recomputed when AQI values change
+_country_styles = {"key": None, "styles": {}}
+
+def get_country_styles(country_aqi_map):
+    '''
+    Returns the style of every country of the GeoJSON index, coloured by the AQI of its capital.
+    '''
+    key = tuple(sorted(country_aqi_map.items()))
+    if _country_styles["key"] != key:
+        _, index = get_countries()
+        styles = {}
+        for country_name in index:
+            if country_name == "Antarctica":
+                styles[country_name] = {"fillOpacity": 0, "weight": 0, "color": "white", "fillColor": "white"}
+            else:
+                styles[country_name] = {
+                    "fillOpacity": 0.7,
+                    "weight": 0.5,
+                    "color": "white",
+                    "fillColor": get_aqi_color(country_aqi_map.get(country_name, None))
+                }
+        _country_styles["key"] = key
+        _country_styles["styles"] = styles
+    return _country_styles["styles"]
+
 def render_centered_table(df, aqi_col=True):
     '''
     Renders a pandas DataFrame with centered column styles.
@@ -97,6 +86,42 @@ def render_centered_table(df, aqi_col=True):
     styled = df.style.set_table_styles(styles).hide(axis="index")
     st.markdown(styled.to_html(), unsafe_allow_html=True)
 
+@st.fragment(run_every=SWEEP_POLL_SECONDS)
+def show_sweep_progress():
+    '''
+    Shows the progress of the sweep requested with the Update button and redraws the page,
+    when the ingest worker published a new sweep. Only this fragment is rerun while waiting, not the whole page,
+    and it reads the database only while a requested sweep is running.
+    '''
+    newest = latest_sweep()
+    if st.session_state.setdefault("seen_sweep", newest) != newest:
+        # the cached data was already dropped by the listener of the process
+        st.session_state["seen_sweep"] = newest
+        st.rerun(scope="app")
+
+    sweep_id = st.session_state.get("sweep_id")
+    if sweep_id is not None:
+        sweep = get_db().get_sweep(sweep_id)
+        if sweep is not None and sweep["status"] in ("queued", "running"):
+            if sweep["status"] == "queued":
+                st.progress(0.0, text="Update is waiting for the ingest worker ...")
+            else:
+                total = sweep["total"] or 0
+                st.progress(sweep["done"] / total if total else 0.0, text=f"Loading new data: {sweep['done']} of {total or '?'} capitals")
+            return
+        del st.session_state["sweep_id"]
+        st.session_state["last_sweep"] = sweep
+
+    sweep = st.session_state.get("last_sweep")
+    if sweep is None:
+        return
+    if sweep["status"] == "done":
+        st.success(f"Update finished: {sweep['inserted']} capitals saved.")
+        if sweep["rejected"]:
+            st.warning(f"{sweep['rejected']} capitals had invalid data and were skipped.")
+    else:
+        st.error(f"Update failed: {sweep['error']}")
+
 def show_worldmap():
     '''
     Displays a worldmap with countries coloured by the AQI value of their capital.
@@ -129,15 +154,15 @@ def show_worldmap():
     </div>
     """, unsafe_allow_html=True)
 
-    # loading GeoJSON with land boarders
-    geojson_url = "https://raw.githubusercontent.com/johan/world.geo.json/master/countries.geo.json"
-    countries_geojson = requests.get(geojson_url).json()
-
-    # loading database
-    db = PostgresDB()
+    # loading GeoJSON with land boarders (simplified, cached on disk and loaded once per process)
+    try:
+        countries_geojson, _ = get_countries()
+    except Exception as e:
+        countries_geojson = None
+        st.warning(f"Country borders are not available: {e}")
 
-    # loading capitals data
-    aqi = db.get_latest_aqi_per_city()
+    # loading capitals data (cached until the next sweep)
+    aqi = latest_aqi_per_city()
 
     # loading recent AQI data out of capitals_data.json or runs without data 
     try:
@@ -149,17 +174,10 @@ def show_worldmap():
     # maps the country with colour by it's capital AQI
     country_aqi_map = {c["country"]: c["aqi"] for c in aqi}
 
+    styles = get_country_styles(country_aqi_map) if countries_geojson else {}
+
     def style_function(feature):
-        country_name = feature["properties"]["name"]
-        if country_name == "Antarctica":
-            return {"fillOpacity": 0, "weight": 0, "color": "white", "fillColor": "white"}
-        aqi = country_aqi_map.get(country_name, None)
-        return {
-            "fillOpacity": 0.7,
-            "weight": 0.5,
-            "color": "white",
-            "fillColor": get_aqi_color(aqi)
-        }
+        return styles[feature["properties"]["name"]]
 
     # defining borders for the map
     min_lat, max_lat = -60, 75    # without arctis and antarctis
@@ -170,23 +188,24 @@ def show_worldmap():
     center_lon = 0
 
     # start zoom (default)
-    zoom_level = 2
+    zoom_level = MIN_ZOOM
 
     # map configurations
     m = folium.Map(
         location=[center_lat, center_lon],
         zoom_start=zoom_level,
         min_zoom=zoom_level,
-        max_zoom=8,           
+        max_zoom=MAX_ZOOM,
         tiles="CartoDB positron",
         max_bounds=True
     )
 
-    folium.GeoJson(
-        countries_geojson,
-        style_function=style_function,
-        tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=[""], labels=False, sticky=False)
-    ).add_to(m)
+    if countries_geojson:
+        folium.GeoJson(
+            countries_geojson,
+            style_function=style_function,
+            tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=[""], labels=False, sticky=False)
+        ).add_to(m)
 
     # mapping the capitals on the worldmap
     for capital in aqi:
@@ -204,37 +223,13 @@ def show_worldmap():
     st_folium(m, use_container_width=True, height=600)
 
     if st.button("🔄 Update"):
-        st.info("Update can take up to 5 minutes.")
-        with st.spinner("Loading new data..."):
-            capitals_list = get_capitals()
-            inserted_rows = []
-
-            for entry in capitals_list:
-                country = entry["country"]
-                capital = entry["city"]
-                aqi_data = get_aqi_for_city(capital, country)
-
-                if aqi_data:
-                    aqi_value = safe_int(aqi_data.get("aqi"))
-                    if aqi_value is not None:
-                        db.insert_aqi(
-                            country=country,
-                            city=capital,
-                            lat=aqi_data["lat"],
-                            lon=aqi_data["lon"],
-                            aqi=aqi_value,
-                            timestamp=aqi_data["timestamp"]
-                        )
-                        inserted_rows.append({
-                            "country": country,
-                            "city": capital,
-                            "lat": aqi_data["lat"],
-                            "lon": aqi_data["lon"],
-                            "aqi": aqi_value,
-                            "timestamp": aqi_data["timestamp"]
-                        })
-
-            st.success("Update finished.")
+        sweep_id = update_aqi_data()
+        if sweep_id is None:
+            st.warning("The update could not be queued, please try again.")
+        else:
+            st.session_state["sweep_id"] = sweep_id
+            st.session_state.pop("last_sweep", None)
+    show_sweep_progress()
 
     # --------- TAB & DROPDOWN STYLING (CSS) ----------
     st.markdown("""
@@ -311,15 +306,8 @@ label {
 """, unsafe_allow_html=True)
     
     # --- Comparison Tool ---
-    # DataFrame with capitals data
-    df_aqi = pd.DataFrame(aqi)
-
-    capitals = get_capitals()
-
-    df_capitals = pd.DataFrame(capitals)[["country", "continent"]]
-
-    # merge dataframes
-    df = pd.merge(df_aqi, df_capitals, on="country", how="left")
+    # DataFrame with capitals data merged with their continents (cached until the next sweep)
+    df = latest_aqi_with_continents()
 
     # Comparison tool of two capitals
     st.markdown("## City Comparison Tool")
@@ -6,46 +6,26 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta, time
 import matplotlib.pyplot as plt
-import joblib
 import pytz  
 
-from backend.data.new_database import PostgresDB
-
-def model_filename(city):
-    return f"{city}_prophet.pkl"
+from backend.models.forecast_service import get_forecast_service
+from frontend.data_cache import countries as cached_countries, cities as cached_cities, city_history
 
 def predict_aqi_for_city_and_time_from_model(city: str, target_timestamp: pd.Timestamp):
-    model_path = f"backend/models/saved_models/{model_filename(city)}"
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"No model for {city} exists. Please train a model first.")
-    model = joblib.load(model_path)
-    # Prophet akzeptiert keine Zeitzonen! Entferne sie:
-    if getattr(target_timestamp, "tzinfo", None) is not None:
-        target_timestamp = target_timestamp.tz_localize(None)
-    future = pd.DataFrame({'ds': [target_timestamp]})
-    forecast = model.predict(future)
-    pred = forecast.iloc[0]
-    return pred['ds'], pred['yhat']
+    # precomputed forecasts, the saved model and results of earlier requests are used by the forecast service
+    return get_forecast_service().get_forecast(city, target_timestamp)
 
 def show_aqi_plots():
     st.title("AQI-Time-series-analytics & Prediction")
 
-    db = PostgresDB()
-    entries = db.get_all_aqi()
-    if not entries:
+    countries = cached_countries()
+    if not countries:
         st.warning("The database is empty.")
         return
 
-    df = pd.DataFrame(entries, columns=["id", "country", "city", "lat", "lon", "aqi", "timestamp"])
-
-    # Zeitstempel als UTC einlesen und nach Europe/Berlin konvertieren
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    df["timestamp"] = df["timestamp"].dt.tz_convert("Europe/Berlin")
-
-    countries = sorted(df["country"].unique())
     selected_country = st.selectbox("Choose a country", countries)
 
-    cities = sorted(df[df["country"] == selected_country]["city"].unique())
+    cities = cached_cities(selected_country)
     selected_city = st.selectbox("Stadt wählen", cities)
 
     time_options = {
@@ -53,17 +33,31 @@ def show_aqi_plots():
         "Letzte 7 Tage": timedelta(days=7),
         "Letzte 30 Tage": timedelta(days=30),
     }
+    # longer periods are read from the hourly aggregates
+    resolutions = {
+        "Letzte 24 Stunden": "raw",
+        "Letzte 7 Tage": "hourly",
+        "Letzte 30 Tage": "hourly",
+    }
     selected_period_label = st.selectbox("Choose a timestamp", list(time_options.keys()))
     selected_period = time_options[selected_period_label]
 
+    # filters, column selection and time range run in SQL, the result is cached until the next sweep
+    df_history = city_history(
+        selected_city,
+        selected_country,
+        selected_period.days,
+        resolutions[selected_period_label]
+    ).copy()
+
+    # Zeitstempel als UTC einlesen und nach Europe/Berlin konvertieren
+    df_history["timestamp"] = pd.to_datetime(df_history["timestamp"], utc=True)
+    df_history["timestamp"] = df_history["timestamp"].dt.tz_convert("Europe/Berlin")
+
     now_berlin = pd.Timestamp.now(tz="Europe/Berlin")
     time_threshold = now_berlin - selected_period
 
-    df_filtered = df[
-        (df["country"] == selected_country) &
-        (df["city"] == selected_city) &
-        (df["timestamp"] >= time_threshold)
-    ].sort_values("timestamp")
+    df_filtered = df_history[df_history["timestamp"] >= time_threshold].sort_values("timestamp")
 
     if df_filtered.empty:
         st.warning(f"No data for {selected_city} at timestamp {selected_period_label}.")
@@ -6,13 +6,36 @@ import streamlit as st
 import plotly.graph_objects as go
 import folium
 from streamlit_folium import st_folium
-from backend.api import fetch_aqi
+from frontend.data_cache import lookup_aqi
+from frontend.city_index import get_city_index
 from backend.features.features import aqi_advice, aqi_color
 
 # Initialize favorites safely
 if "favorites" not in st.session_state:
     st.session_state.favorites = {}
 
+def resolve_city(query):
+    '''
+    Returns the canonical name of the typed city. If no city matches exactly, the user picks one of the suggestions.
+    Names without suggestions are searched as typed.
+    '''
+    query = query.strip()
+    if not query:
+        return query
+    index = get_city_index()
+    canonical = index.resolve(query)
+    if canonical:
+        return canonical
+    suggestions = index.suggest(query)
+    if not suggestions:
+        return query
+    labels = {
+        entry["city"]: f"{entry['city']}, {entry['country']}" if entry.get("country") else entry["city"]
+        for entry in suggestions
+    }
+    labels.setdefault(query, f'Search "{query}" as typed')
+    return st.selectbox("Did you mean", list(labels), format_func=labels.get, key="city_suggestion")
+
 def show_search():
     # CSS styling for favorite button
     st.markdown("""
@@ -43,7 +66,7 @@ def show_search():
 
     col_search, col_fav = st.columns([5, 1])
     with col_search:
-        city = st.text_input("Enter a city name", key="city_search")
+        city = resolve_city(st.text_input("Enter a city name", key="city_search"))
 
     if "favorites" not in st.session_state:
         st.session_state.favorites = {}
@@ -70,7 +93,7 @@ def show_search():
 
     if city:
         with st.spinner("Fetching air quality data..."):
-            response = fetch_aqi(city)
+            response = lookup_aqi(city)
 
         if response and isinstance(response, dict):
             aqi = response.get("aqi", None)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from backend import api
+from backend.http_client import CircuitOpenError
+
+
+class StubWAQI:
+    '''
+    Answers the feed requests of the WAQI API from a dict {city: aqi}, unknown cities get an error status.
+    '''
+    def __init__(self, aqi_by_city, delay=0.0):
+        self.aqi_by_city = aqi_by_city
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def get_json(self, url, timeout=None):
+        city = url.split("/feed/")[1].split("/")[0]
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if city not in self.aqi_by_city:
+                return {"status": "error", "data": "Unknown station"}
+            return {"status": "ok", "data": {"aqi": self.aqi_by_city[city], "city": {"geo": [52.5, 13.4]}}}
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def waqi(monkeypatch):
+    stub = StubWAQI({f"City{i}": 10 + i for i in range(20)})
+    monkeypatch.setattr(api, "get_client", lambda: stub)
+    return stub
+
+
+def capitals(n):
+    return [{"city": f"City{i}", "country": f"Country{i}"} for i in range(n)]
+
+
+def test_fetch_aqi_parses_the_feed(waqi):
+    data = api.fetch_aqi("City3")
+    assert data["city"] == "City3"
+    assert data["aqi"] == 13
+    assert (data["lat"], data["lon"]) == (52.5, 13.4)
+
+
+def test_fetch_aqi_returns_none_for_unknown_city(waqi):
+    assert api.fetch_aqi("Atlantis") is None
+
+
+def test_fetch_aqi_returns_none_while_circuit_is_open(monkeypatch):
+    class OpenClient:
+        def get_json(self, url, timeout=None):
+            raise CircuitOpenError("paused")
+    monkeypatch.setattr(api, "get_client", lambda: OpenClient())
+    assert api.fetch_aqi("City1") is None
+
+
+def test_fetch_for_capitals_keeps_the_order_and_bounds_the_workers(waqi):
+    waqi.delay = 0.01
+    results = api.fetch_aqi_for_capitals(capitals(20), max_workers=4)
+    assert [entry["city"] for entry, _, _ in results] == [f"City{i}" for i in range(20)]
+    assert [aqi_data["aqi"] for _, aqi_data, _ in results] == [10 + i for i in range(20)]
+    assert 1 < waqi.max_running <= 4
+
+
+def test_fetch_for_capitals_sequential_with_one_worker(waqi):
+    api.fetch_aqi_for_capitals(capitals(5), max_workers=1)
+    assert waqi.max_running == 1
+
+
+def test_fetch_for_capitals_reports_progress(waqi):
+    progress = []
+    api.fetch_aqi_for_capitals(capitals(6), max_workers=3, on_progress=lambda done, total: progress.append((done, total)))
+    assert progress == [(done, 6) for done in range(1, 7)]
+
+
+def test_report_sweep_lists_failed_capitals(waqi):
+    entries = capitals(3) + [{"city": "Atlantis", "country": "Nowhere"}]
+    report = api.report_sweep(api.fetch_aqi_for_capitals(entries, max_workers=2), wall_time=1.5)
+    assert report["capitals"] == 4
+    assert report["failed"] == ["Atlantis"]
+    assert set(report["latencies"]) == {"City0", "City1", "City2", "Atlantis"}
+
+
+def test_fetch_and_store_saves_one_bulk_insert(waqi, monkeypatch):
+    class StubDB:
+        def __init__(self):
+            self.batches = []
+
+        def insert_aqi_bulk(self, rows):
+            self.batches.append(rows)
+            return {"inserted": len(rows), "rejected": []}
+
+    db = StubDB()
+    monkeypatch.setattr(api, "get_db", lambda: db)
+    monkeypatch.setattr(api, "get_capitals", lambda: capitals(3) + [{"city": "Atlantis", "country": "Nowhere"}])
+    report = api.fetch_and_store_aqi_for_all_countries(max_workers=2)
+    assert len(db.batches) == 1
+    assert [row["city"] for row in db.batches[0]] == ["City0", "City1", "City2"]
+    assert report["inserted"] == 3
+    assert report["failed"] == ["Atlantis"]
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from backend.models import backtest
+from backend.models.backtest import (
+    PredictionCache, rolling_cutoffs, target_times, match_actuals, horizon_errors, training_windows
+)
+
+
+def hourly(start, hours):
+    return pd.date_range(start, periods=hours, freq="h").to_numpy(dtype="datetime64[ns]")
+
+
+def test_rolling_cutoffs_start_at_the_next_full_hour():
+    ds = hourly("2025-06-01", 48)
+    cutoffs = rolling_cutoffs(ds, "2025-06-01 10:20", horizons=[1, 6], step_hours=6)
+    assert pd.Timestamp(cutoffs[0]) == pd.Timestamp("2025-06-01 11:00")
+    assert np.all(np.diff(cutoffs) == np.timedelta64(6, "h"))
+    # the shortest horizon of the last cutoff is still covered by the data
+    assert cutoffs[-1] + np.timedelta64(1, "h") <= ds[-1]
+    assert cutoffs[-1] + np.timedelta64(7, "h") > ds[-1]
+
+
+def test_rolling_cutoffs_without_enough_data():
+    assert len(rolling_cutoffs(hourly("2025-06-01", 3), "2025-06-01 02:00", horizons=[6])) == 0
+    assert len(rolling_cutoffs(np.array([], dtype="datetime64[ns]"), "2025-06-01", horizons=[1])) == 0
+
+
+def test_target_times_shape():
+    cutoffs = hourly("2025-06-01", 2)
+    targets = target_times(cutoffs, [1, 24])
+    assert targets.shape == (2, 2)
+    assert pd.Timestamp(targets[1, 1]) == pd.Timestamp("2025-06-02 01:00")
+
+
+def test_match_actuals_takes_the_nearest_value_within_tolerance():
+    ds = np.array(["2025-06-01T10:05", "2025-06-01T11:50", "2025-06-01T14:00"], dtype="datetime64[ns]")
+    y = np.array([1.0, 2.0, 3.0])
+    targets = np.array([["2025-06-01T10:00", "2025-06-01T12:00", "2025-06-01T13:00"]], dtype="datetime64[ns]")
+    actuals = match_actuals(ds, y, targets)
+    assert actuals[0, 0] == 1.0
+    assert actuals[0, 1] == 2.0
+    # the nearest measurement is an hour away
+    assert np.isnan(actuals[0, 2])
+
+
+def test_horizon_errors_skip_missing_actuals():
+    predictions = np.array([[1.0, 2.0], [3.0, 4.0]])
+    actuals = np.array([[2.0, np.nan], [1.0, 4.0]])
+    mae, rmse, counts = horizon_errors(predictions, actuals)
+    assert mae.tolist() == [1.5, 0.0]
+    assert np.isclose(rmse[0], np.sqrt((1 + 4) / 2))
+    assert counts.tolist() == [2, 1]
+
+
+def test_training_windows_end_at_the_cutoff():
+    ds = hourly("2025-06-01", 24 * 5)
+    cutoffs = np.array(["2025-06-03T00:00", "2025-06-05T00:00"], dtype="datetime64[ns]")
+    starts, ends = training_windows(ds, cutoffs, train_days=1)
+    assert ds[ends[0] - 1] == cutoffs[0]
+    assert ds[starts[0]] == cutoffs[0] - np.timedelta64(23, "h")
+    assert (ends - starts).tolist() == [24, 24]
+
+
+def test_prediction_cache_roundtrip(tmp_path):
+    cache = PredictionCache(tmp_path)
+    predictions = {10: ("key-a", np.array([1.0, 2.0])), 20: ("key-b", np.array([3.0, np.nan]))}
+    cache.save("Berlin", [1, 6], predictions)
+    loaded = cache.load("Berlin", [1, 6])
+    assert sorted(loaded) == [10, 20]
+    assert loaded[10][0] == "key-a"
+    assert np.array_equal(loaded[20][1], predictions[20][1], equal_nan=True)
+    # other horizons drop the cache
+    assert cache.load("Berlin", [1, 24]) == {}
+
+
+def test_backtest_refits_only_new_or_changed_cutoffs(tmp_path, monkeypatch):
+    fitted = []
+
+    def fake_refit(model, ds, y, cutoffs, windows, horizons):
+        fitted.append(len(cutoffs))
+        return np.zeros((len(cutoffs), len(horizons)))
+
+    monkeypatch.setattr(backtest, "refit_cutoffs", fake_refit)
+    ds = hourly("2025-06-01", 24 * 6)
+    y = np.full(len(ds), 5.0, dtype=np.float32)
+    cache = PredictionCache(tmp_path)
+    options = {"horizons": [1, 6], "step_hours": 12, "train_days": 2}
+
+    first = backtest.backtest_city("Berlin", None, ds, y, "2025-06-05", cache, **options)
+    assert first["cached_cutoffs"] == 0
+    assert first["MAE_1h"] == 5.0
+    # the hour-of-day baseline of a constant series is exact
+    assert first["baseline_MAE_1h"] == 0.0
+
+    second = backtest.backtest_city("Berlin", None, ds, y, "2025-06-05", cache, **options)
+    assert second["cached_cutoffs"] == second["cutoffs"]
+    assert fitted == [first["cutoffs"]]
+
+    # a changed value only invalidates the cutoffs whose training window contains it
+    y = y.copy()
+    y[ds == np.datetime64("2025-06-06T06:00")] = 7.0
+    third = backtest.backtest_city("Berlin", None, ds, y, "2025-06-05", cache, **options)
+    assert third["cutoffs"] - third["cached_cutoffs"] == 1
+    assert fitted == [first["cutoffs"], 1]
+
+
+def test_failed_refit_only_skips_its_cutoff(monkeypatch):
+    class Fitted:
+        def predict(self, future):
+            return pd.DataFrame({"yhat": np.ones(len(future))})
+
+    fits = []
+
+    def fit_model(train_df, init=None):
+        fits.append(len(fits))
+        if len(fits) == 2:
+            raise RuntimeError("Error during optimization!")
+        return Fitted()
+
+    monkeypatch.setattr(backtest, "fit_model", fit_model)
+    ds = hourly("2025-06-01", 24 * 4)
+    y = np.full(len(ds), 5.0)
+    cutoffs = np.array(["2025-06-02T00:00", "2025-06-02T12:00", "2025-06-03T00:00"], dtype="datetime64[ns]")
+    windows = training_windows(ds, cutoffs, train_days=1)
+    predictions = backtest.refit_cutoffs(None, ds, y, cutoffs, windows, [1, 6])
+    assert len(fits) == 3
+    assert predictions[0].tolist() == [1.0, 1.0]
+    assert np.isnan(predictions[1]).all()
+    assert predictions[2].tolist() == [1.0, 1.0]
@@ -0,0 +1,98 @@
+import pytest
+
+from backend.data import cache
+from backend.data.cache import TTLCache, cached_query, invalidate_cache
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_entries_expire_after_ttl(clock):
+    ttl_cache = TTLCache(maxsize=4, ttl=10)
+    ttl_cache.set("a", 1)
+    clock.now += 9
+    assert ttl_cache.get("a") == (True, 1)
+    clock.now += 2
+    assert ttl_cache.get("a") == (False, None)
+    assert ttl_cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+    assert ttl_cache.get("b") == (False, None)
+    assert ttl_cache.get("a") == (True, 1)
+    assert ttl_cache.stats()["evictions"] == 1
+
+
+def test_value_of_an_older_generation_is_not_stored(clock):
+    ttl_cache = TTLCache(maxsize=4, ttl=10)
+    generation = ttl_cache.generation
+    # new data is ingested while the value is computed
+    ttl_cache.clear()
+    ttl_cache.set("a", "stale", generation=generation)
+    assert ttl_cache.get("a") == (False, None)
+
+    ttl_cache.set("a", "fresh", generation=ttl_cache.generation)
+    assert ttl_cache.get("a") == (True, "fresh")
+
+
+def test_stats_count_hits_and_misses(clock):
+    ttl_cache = TTLCache(maxsize=4, ttl=10)
+    ttl_cache.get("a")
+    ttl_cache.set("a", 1)
+    ttl_cache.get("a")
+    stats = ttl_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_cached_query_is_keyed_by_arguments_and_invalidated(monkeypatch, clock):
+    monkeypatch.setattr(cache, "query_cache", TTLCache(maxsize=16, ttl=10))
+    calls = []
+
+    @cached_query
+    def history(city, days=1):
+        calls.append((city, days))
+        return [city] * days
+
+    assert history("Berlin") == ["Berlin"]
+    assert history("Berlin") == ["Berlin"]
+    assert history("Berlin", days=2) == ["Berlin", "Berlin"]
+    assert calls == [("Berlin", 1), ("Berlin", 2)]
+
+    invalidate_cache()
+    history("Berlin")
+    assert calls[-1] == ("Berlin", 1)
+    assert len(calls) == 3
+
+
+def test_cached_query_does_not_store_results_computed_before_an_invalidation(monkeypatch, clock):
+    monkeypatch.setattr(cache, "query_cache", TTLCache(maxsize=16, ttl=10))
+    calls = []
+
+    @cached_query
+    def latest():
+        calls.append(1)
+        # a sweep is ingested while the query runs
+        if len(calls) == 1:
+            invalidate_cache()
+        return len(calls)
+
+    assert latest() == 1
+    assert latest() == 2
+    assert latest() == 2
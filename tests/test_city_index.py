@@ -0,0 +1,56 @@
+from frontend.city_index import CityIndex, fold, trigrams
+
+
+def make_index(*names):
+    return CityIndex([{"city": name} for name in names])
+
+
+def test_fold_drops_accents_dots_and_case():
+    assert fold("Washington, D.C.") == "washington dc"
+    assert fold("  São   Tomé ") == "sao tome"
+    assert fold("N'Djamena") == "ndjamena"
+
+
+def test_trigrams_are_padded():
+    assert trigrams("rom") == {"  r", " ro", "rom", "om "}
+
+
+def test_duplicate_and_empty_names_are_skipped():
+    index = make_index("Paris", "PARIS", "...")
+    assert [entry["city"] for entry in index.entries] == ["Paris"]
+
+
+def test_resolve_returns_the_canonical_name():
+    index = make_index("Bogotá", "Washington, D.C.")
+    assert index.resolve("bogota") == "Bogotá"
+    assert index.resolve("washington dc") == "Washington, D.C."
+    assert index.resolve("bogo") is None
+
+
+def test_prefix_matches_any_word_of_the_name():
+    index = make_index("Mexico City", "Kuwait City", "Cityville")
+    assert [entry["city"] for entry in index.suggest("city")] == ["Cityville", "Mexico City", "Kuwait City"]
+
+
+def test_names_starting_with_the_text_come_first_then_shorter_names():
+    index = make_index("Port Louis", "Saint Louis", "Louisville", "Lou")
+    assert [entry["city"] for entry in index.suggest("lou")] == ["Lou", "Louisville", "Port Louis", "Saint Louis"]
+
+
+def test_fuzzy_suggestions_follow_prefix_matches():
+    index = make_index("Berlin", "Bern", "Dublin")
+    names = [entry["city"] for entry in index.suggest("berlni")]
+    # no prefix match for the typo, the most similar name first
+    assert names[0] == "Berlin"
+    assert "Dublin" not in names
+
+
+def test_fuzzy_suggestions_need_a_minimal_similarity():
+    index = make_index("Berlin", "Tokyo")
+    assert index.suggest("xyzzy") == []
+    assert index.suggest("  ") == []
+
+
+def test_suggest_respects_the_limit():
+    index = make_index(*[f"Saint {name}" for name in "ABCDEFGH"])
+    assert len(index.suggest("saint", limit=3)) == 3
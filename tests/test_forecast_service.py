@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.models import forecast_service
+from backend.models.forecast_service import ForecastService
+from backend.models.model_store import ModelStore
+from backend.models.registry import ModelRegistry
+from backend.models.train_model import train_city
+
+
+class NoForecasts:
+    def get_forecast(self, city, hour):
+        return None
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    # 30 days of hourly data up to now, the model is fitted on the first 80%
+    ds = pd.date_range(end=datetime.now().replace(minute=0, second=0, microsecond=0), periods=24 * 30, freq="h")
+    y = (50 + 10 * np.sin(np.arange(len(ds)) * 2 * np.pi / 24)).astype(np.float32)
+    report = train_city("Berlin", tmp_path, arrays=(ds.to_numpy(dtype="datetime64[ns]"), y))
+    assert report["status"] == "trained"
+    registry = ModelRegistry(tmp_path)
+    monkeypatch.setattr(forecast_service, "get_registry", lambda: registry)
+    monkeypatch.setattr(forecast_service, "get_db", lambda: NoForecasts())
+    return registry
+
+
+def test_model_trained_a_moment_ago_is_served_without_refit(registry, monkeypatch):
+    def refit(self, city, days):
+        raise AssertionError("the saved model should be used")
+
+    monkeypatch.setattr(ForecastService, "_refit", refit)
+    service = ForecastService(max_age_hours=24)
+    # the training data ends days ago, the model was trained now
+    assert datetime.now() - pd.Timestamp(registry.get("Berlin").history["ds"].max()) > timedelta(days=5)
+    assert service.model("Berlin") is registry.get("Berlin")
+
+    ds, yhat = service.get_forecast("Berlin", datetime.now() + timedelta(hours=3))
+    assert np.isfinite(yhat)
+    assert service.stats()["refits"] == 0
+
+
+def test_model_trained_long_ago_is_refitted(registry, monkeypatch, tmp_path):
+    store = ModelStore(tmp_path)
+    manifest = store._read_manifest_file()
+    manifest["models"]["Berlin"]["trained_at"] = (datetime.now() - timedelta(days=2)).isoformat(timespec="seconds")
+    store._write_manifest_file(manifest)
+
+    refitted = object()
+    monkeypatch.setattr(ForecastService, "_refit", lambda self, city, days: refitted)
+    assert ForecastService(max_age_hours=24).model("Berlin") is refitted
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.models.forecasters import Forecaster, HourOfDayForecaster, fit_hour_profiles, get_forecaster
+
+
+def series(start, values_by_hour, days):
+    '''
+    Hourly series whose value only depends on the hour of the day (and the day, if values_by_hour is callable).
+    '''
+    ds = pd.date_range(start, periods=24 * days, freq="h")
+    if callable(values_by_hour):
+        y = np.array([values_by_hour(day, hour) for day, hour in zip(ds.dayofyear - ds[0].dayofyear, ds.hour)], dtype=float)
+    else:
+        y = np.array([values_by_hour[hour] for hour in ds.hour], dtype=float)
+    return ds.to_numpy(dtype="datetime64[ns]"), y
+
+
+def test_profile_of_a_daily_pattern():
+    pattern = np.arange(24) * 2.0
+    profile = fit_hour_profiles([series("2025-06-01", pattern, days=3)])
+    assert profile.shape == (1, 24)
+    assert np.allclose(profile[0], pattern)
+
+
+def test_levels_are_smoothed_day_by_day():
+    ds, y = series("2025-06-01", lambda day, hour: [10.0, 20.0][day], days=2)
+    profile = fit_hour_profiles([(ds, y)], alpha=0.5)
+    assert np.allclose(profile[0], 15.0)
+
+
+def test_hours_without_data_get_the_mean_of_the_series():
+    ds, y = series("2025-06-01", np.arange(24.0), days=1)
+    keep = pd.DatetimeIndex(ds).hour != 5
+    profile = fit_hour_profiles([(ds[keep], y[keep])])
+    assert profile[0, 5] == pytest.approx(y[keep].mean())
+
+
+def test_batch_matches_single_fits():
+    first = series("2025-06-01", np.arange(24.0), days=4)
+    second = series("2025-06-02", np.arange(24.0)[::-1] + 3, days=2)
+    batch = fit_hour_profiles([first, second])
+    assert np.allclose(batch[0], fit_hour_profiles([first])[0])
+    assert np.allclose(batch[1], fit_hour_profiles([second])[0])
+
+
+def test_fit_batch_skips_empty_series_and_predicts_by_hour():
+    ds, y = series("2025-06-01", np.arange(24.0), days=2)
+    empty = (np.array([], dtype="datetime64[ns]"), np.array([]))
+    baselines = HourOfDayForecaster.fit_batch({"Berlin": (ds, y), "Nowhere": empty})
+    assert list(baselines) == ["Berlin"]
+    prediction = baselines["Berlin"].predict(pd.to_datetime(["2025-07-01 03:00", "2025-07-01 22:30"]))
+    assert np.allclose(prediction, [3.0, 22.0])
+
+
+def test_fit_matches_fit_batch():
+    ds, y = series("2025-06-01", np.arange(24.0) + 1, days=3)
+    single = HourOfDayForecaster().fit(pd.DataFrame({"ds": ds, "y": y}))
+    batch = HourOfDayForecaster.fit_batch({"Berlin": (ds, y)})["Berlin"]
+    assert np.allclose(single.profile, batch.profile)
+
+
+def test_incomplete_forecaster_can_not_be_created():
+    class FitOnly(Forecaster):
+        def fit(self, df):
+            return self
+
+    with pytest.raises(TypeError):
+        FitOnly()
+
+
+def test_get_forecaster_by_name():
+    assert isinstance(get_forecaster("hour_of_day", alpha=0.5), HourOfDayForecaster)
+    with pytest.raises(ValueError):
+        get_forecaster("arima")
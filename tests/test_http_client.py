@@ -0,0 +1,150 @@
+import pytest
+import requests
+
+from backend import http_client
+from backend.http_client import HTTPClient, CircuitBreaker, CircuitOpenError, HostRateLimiter
+
+
+class FakeTime:
+    '''
+    Clock of the tests: sleep only moves the time forward.
+    '''
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    '''
+    Returns the scripted responses in order, an exception in the script is raised.
+    '''
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        result = self.script.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(http_client, "time", fake)
+    return fake
+
+
+def make_client(script, max_retries=3, rate_limit=0):
+    client = HTTPClient(max_retries=max_retries, backoff_base=0.5, backoff_max=8, rate_limit=rate_limit)
+    client.session = FakeSession(script)
+    return client
+
+
+def test_get_retries_connection_errors_and_status_codes(clock):
+    client = make_client([requests.ConnectionError("reset"), FakeResponse(503), FakeResponse(200, {"status": "ok"})])
+    assert client.get_json("https://api.waqi.info/feed/Berlin/") == {"status": "ok"}
+    assert client.session.calls == 3
+    assert len(clock.sleeps) == 2
+    assert client.breaker("https://api.waqi.info/").state == "closed"
+
+
+def test_get_raises_the_last_error_after_all_retries(clock):
+    client = make_client([requests.Timeout("slow")] * 3, max_retries=2)
+    with pytest.raises(requests.Timeout):
+        client.get("https://api.waqi.info/feed/Berlin/")
+    assert client.session.calls == 3
+
+
+def test_get_does_not_retry_client_errors(clock):
+    client = make_client([FakeResponse(404)])
+    with pytest.raises(requests.HTTPError):
+        client.get("https://api.waqi.info/feed/Nowhere/")
+    assert client.session.calls == 1
+    assert clock.sleeps == []
+    assert client.breaker("https://api.waqi.info/").failures == 0
+
+
+def test_backoff_is_capped_full_jitter(monkeypatch):
+    client = HTTPClient(backoff_base=0.5, backoff_max=8, rate_limit=0)
+    monkeypatch.setattr(http_client.random, "uniform", lambda low, high: high)
+    assert [client.backoff(attempt) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8, 8]
+
+
+def test_circuit_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_circuit_breaker_half_open_allows_one_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    clock.now += 61
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # a failed trial opens the breaker again
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 61
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_open_circuit_blocks_requests(clock):
+    client = make_client([requests.ConnectionError("down")] * 5, max_retries=0)
+    for _ in range(5):
+        with pytest.raises(requests.ConnectionError):
+            client.get("https://api.waqi.info/feed/Berlin/")
+    with pytest.raises(CircuitOpenError):
+        client.get("https://api.waqi.info/feed/Paris/")
+    assert client.session.calls == 5
+
+
+def test_rate_limiter_spaces_requests_per_host(clock):
+    limiter = HostRateLimiter(rate_per_second=4)
+    for _ in range(3):
+        limiter.wait("https://api.waqi.info/feed/a/")
+    assert clock.sleeps == [0.25, 0.25]
+
+    # another host has its own slots
+    limiter.wait("https://example.org/")
+    assert clock.sleeps == [0.25, 0.25]
+
+
+def test_rate_limiter_without_limit_never_sleeps(clock):
+    limiter = HostRateLimiter(rate_per_second=0)
+    for _ in range(10):
+        limiter.wait("https://api.waqi.info/")
+    assert clock.sleeps == []
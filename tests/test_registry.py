@@ -0,0 +1,26 @@
+import tracemalloc
+
+from backend.models.model_store import MODEL_DIR, ModelStore
+from backend.models.registry import ModelRegistry, measure_memory
+
+
+def test_measure_memory_counts_what_the_load_keeps():
+    result, size = measure_memory(lambda: bytearray(1_000_000))
+    assert len(result) == 1_000_000
+    assert 1_000_000 <= size < 1_100_000
+    assert not tracemalloc.is_tracing()
+
+
+def test_registry_records_the_footprint_and_evicts_least_recently_used():
+    cities = ModelStore(MODEL_DIR).cities()[:3]
+    registry = ModelRegistry(MODEL_DIR, maxsize=2)
+    for city in cities:
+        registry.get(city)
+    registry.get(cities[2])
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+    models = {model["model"]: model for model in stats["models"]}
+    assert not models[cities[0]]["cached"]
+    # a deserialized Prophet model takes more memory than its JSON file
+    assert all(model["memory_bytes"] > model["serialized_bytes"] > 0 for model in models.values())
+    assert stats["memory_bytes"] == models[cities[1]]["memory_bytes"] + models[cities[2]]["memory_bytes"]
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+from backend.data.jobs import JobRecorder
+from backend.data.scheduler import Scheduler, ScheduledJob, every_minutes, daily_at
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLock:
+    def __init__(self, free=False):
+        self.free = free
+        self.holding = False
+
+    def held(self):
+        return self.holding
+
+    def acquire(self):
+        self.holding = self.free
+        return self.holding
+
+    def release(self):
+        self.holding = False
+
+
+def make_scheduler(clock, lock=None, run=None):
+    runs = []
+    job = ScheduledJob("ingest", every_minutes(15), run or (lambda: runs.append(clock())))
+    recorder = JobRecorder(log_path=None)
+    return Scheduler([job], recorder, lock=lock, clock=clock), job, recorder, runs
+
+
+def test_every_minutes_is_aligned_to_the_hour():
+    next_due = every_minutes(15)
+    assert next_due(datetime(2025, 6, 1, 10, 7)) == datetime(2025, 6, 1, 10, 15)
+    assert next_due(datetime(2025, 6, 1, 10, 15)) == datetime(2025, 6, 1, 10, 30)
+    assert next_due(datetime(2025, 6, 1, 23, 50)) == datetime(2025, 6, 2, 0, 0)
+
+
+def test_daily_at_is_today_or_tomorrow():
+    next_due = daily_at("02:00")
+    assert next_due(datetime(2025, 6, 1, 1, 59)) == datetime(2025, 6, 1, 2, 0)
+    assert next_due(datetime(2025, 6, 1, 2, 0)) == datetime(2025, 6, 2, 2, 0)
+    assert next_due(datetime(2025, 12, 31, 3, 0)) == datetime(2026, 1, 1, 2, 0)
+
+
+def test_run_job_counts_missed_runs():
+    clock = FakeClock(datetime(2025, 6, 1, 10, 0))
+    scheduler, job, recorder, runs = make_scheduler(clock)
+    assert scheduler.is_leader()
+    assert job.due == datetime(2025, 6, 1, 10, 15)
+
+    # the scheduler woke up 50 minutes late: 10:30, 10:45 and 11:00 were missed
+    clock.now = datetime(2025, 6, 1, 11, 5)
+    assert scheduler.run_job(job) == 3
+    assert runs == [clock.now]
+    assert job.due == datetime(2025, 6, 1, 11, 15)
+    assert recorder.snapshot()["jobs"]["ingest"]["missed"] == 3
+
+
+def test_run_job_on_time_misses_nothing():
+    clock = FakeClock(datetime(2025, 6, 1, 10, 0))
+    scheduler, job, recorder, _ = make_scheduler(clock)
+    scheduler.is_leader()
+    clock.now = job.due + timedelta(seconds=2)
+    assert scheduler.run_job(job) == 0
+    assert recorder.snapshot()["jobs"]["ingest"]["missed"] == 0
+
+
+def test_failed_job_is_recorded_and_rescheduled():
+    clock = FakeClock(datetime(2025, 6, 1, 10, 0))
+
+    def fail():
+        raise RuntimeError("api down")
+
+    scheduler, job, recorder, _ = make_scheduler(clock, run=fail)
+    scheduler.is_leader()
+    clock.now = job.due
+    scheduler.run_job(job)
+    assert recorder.snapshot()["jobs"]["ingest"]["failed"] == 1
+    assert job.due == datetime(2025, 6, 1, 10, 30)
+
+
+def test_takeover_starts_due_times_at_the_takeover():
+    clock = FakeClock(datetime(2025, 6, 1, 10, 0))
+    lock = FakeLock(free=False)
+    scheduler, job, recorder, runs = make_scheduler(clock, lock=lock)
+    assert not scheduler.is_leader()
+
+    # the other process held the lock for two days
+    clock.now = datetime(2025, 6, 3, 10, 7)
+    lock.free = True
+    assert scheduler.is_leader()
+    assert job.due == datetime(2025, 6, 3, 10, 15)
+    assert job.due > clock.now
+    assert recorder.snapshot()["jobs"] == {}
+    assert runs == []
+
+
+def test_losing_and_regaining_the_lock_resets_the_due_times():
+    clock = FakeClock(datetime(2025, 6, 1, 10, 0))
+    lock = FakeLock(free=True)
+    scheduler, job, recorder, _ = make_scheduler(clock, lock=lock)
+    assert scheduler.is_leader()
+
+    lock.release()
+    lock.free = False
+    assert not scheduler.is_leader()
+
+    clock.now = datetime(2025, 6, 1, 18, 40)
+    lock.free = True
+    assert scheduler.is_leader()
+    assert job.due == datetime(2025, 6, 1, 18, 45)
+    assert "ingest" not in recorder.snapshot()["jobs"]